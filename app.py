@@ -1,22 +1,35 @@
 # app.py
+from typing import Optional
+
 from src.agent.memory_setup import checkpointer, store
-from src.agent.graph import create_initial_state, workflow  # Removida la importación de 'graph'
+from src.agent.graph import _configure_logging, create_initial_state, get_workflow
+from src.agent.state import interaction_history_for_export
 from langgraph.func import entrypoint
 
+# Debug de LangChain sólo si LANGCHAIN_DEBUG=1
+_configure_logging()
 
 @entrypoint(checkpointer=checkpointer, store=store)
-def inmobilia_agent(input_data: dict) -> dict:
-    """Entrypoint principal para el agente inmobiliario."""
+def inmobilia_agent(input_data: dict, *, previous: Optional[dict] = None) -> dict:
+    """Entrypoint principal para el agente inmobiliario.
+
+    `previous` es el resultado del turno anterior del mismo thread (lo guarda el
+    checkpointer): de él sólo se arrastra el índice de resúmenes del historial.
+    """
     # Inicialización con estado completo
     messages = input_data.get("messages", [])
 
     # Creamos un estado inicial completo usando la función importada
     initial_state = create_initial_state()
     initial_state["messages"] = messages
+    msg_index = ((previous or {}).get("context") or {}).get("msg_index")
+    if msg_index:
+        initial_state["context"]["msg_index"] = msg_index
 
-    # Ejecutamos el grafo con el estado inicial
-    result = workflow.invoke(initial_state)
-    return result
+    # Ejecutamos el grafo con el estado inicial (se compila en la primera petición)
+    result = get_workflow().invoke(initial_state)
+    # El historial guarda timestamps en ns; la respuesta los expone en ISO
+    return {**result, "interaction_history": interaction_history_for_export(result)}
 
 
 # Exportar el grafo para langgraph-cli
@@ -5,4 +5,12 @@ Exporta el grafo principal para uso con LangGraph.
 # Evitar referencias circulares
 __all__ = ["graph"]
 
-# No importes desde aquí - LangGraph lo manejará
\ No newline at end of file
+
+def __getattr__(name: str):
+    """Re-exporta `graph` desde el módulo canónico sólo cuando se solicita."""
+    # No importes a nivel de módulo - LangGraph lo manejará
+    if name == "graph":
+        from src.agent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
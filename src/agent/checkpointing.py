@@ -0,0 +1,338 @@
+# src/agent/checkpointing.py
+"""Checkpointer con escritura diferida de subgrafos ("end-of-workflow").
+
+LangGraph persiste un checkpoint por cada super-step de cada subgrafo
+(guardrails, supervisor, agentes). Con un backend remoto eso significa
+decenas de round-trips por turno. `DeferredCheckpointer` envuelve al
+checkpointer real y mantiene en memoria sólo el último checkpoint de cada
+namespace de subgrafo; se persisten cuando llega el siguiente checkpoint del
+namespace raíz (el entrypoint), es decir, al terminar el workflow.
+
+`OrjsonSerializer` serializa con orjson los valores JSON nativos (dicts de
+estado, datos de leads) y delega el resto en el serializador por defecto.
+"""
+import math
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import orjson
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+_Write = Tuple[RunnableConfig, Sequence[Tuple[str, Any]], str, str]
+
+_ORJSON_TYPE = "orjson"
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def _is_plain_json(obj: Any) -> bool:
+    """Indica si `obj` sólo contiene dict/list/str/int/float/bool/None (tipos exactos, claves str).
+
+    orjson acepta tuplas, Enums, UUIDs y subclases de str/int, pero al leerlos
+    vuelven como listas o strings planos: esos valores van al fallback.
+    """
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        kind = type(item)
+        if kind is float and not math.isfinite(item):
+            # orjson escribe NaN/inf como null
+            return False
+        if kind in _JSON_SCALARS:
+            continue
+        if kind is list:
+            stack.extend(item)
+        elif kind is dict:
+            for key, value in item.items():
+                if type(key) is not str:
+                    return False
+                stack.append(value)
+        else:
+            return False
+    return True
+
+
+class OrjsonSerializer(SerializerProtocol):
+    """Serializador orjson con fallback a `JsonPlusSerializer` para objetos no JSON.
+
+    Mensajes de LangChain, modelos pydantic, datetimes, etc. siguen el camino
+    normal; sólo dicts/listas/escalares de tipo exacto se codifican con orjson,
+    de modo que `loads_typed` devuelve siempre los mismos tipos que se guardaron.
+    """
+
+    def __init__(self, fallback: Optional[SerializerProtocol] = None) -> None:
+        """Usa `fallback` (por defecto `JsonPlusSerializer`) para lo que no es JSON plano."""
+        self.fallback = fallback or JsonPlusSerializer()
+
+    def dumps(self, obj: Any) -> bytes:
+        """Serializa con orjson si `obj` es JSON plano; si no, con el fallback."""
+        if _is_plain_json(obj):
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                # Enteros fuera de 64 bits
+                pass
+        return self.fallback.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        """Deserializa con el fallback (`dumps` sin tipo no distingue el formato)."""
+        return self.fallback.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        """Serializa etiquetando el formato: "orjson" o el tipo del fallback."""
+        if _is_plain_json(obj):
+            try:
+                return _ORJSON_TYPE, orjson.dumps(obj)
+            except TypeError:
+                pass
+        return self.fallback.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        """Deserializa según la etiqueta escrita por `dumps_typed`."""
+        type_, payload = data
+        if type_ == _ORJSON_TYPE:
+            return orjson.loads(payload)
+        return self.fallback.loads_typed(data)
+
+
+@dataclass
+class _PendingNamespace:
+    """Estado pendiente de persistir para un (thread_id, checkpoint_ns)."""
+    # Config del primer put diferido: su padre es el último checkpoint persistido
+    config: RunnableConfig
+    checkpoint: Optional[Checkpoint] = None
+    metadata: Optional[CheckpointMetadata] = None
+    # Unión de las versiones nuevas de todos los puts colapsados
+    new_versions: ChannelVersions = field(default_factory=dict)
+    writes: List[_Write] = field(default_factory=list)
+
+
+def _thread_id(config: RunnableConfig) -> str:
+    return str(config["configurable"]["thread_id"])
+
+
+def _checkpoint_ns(config: RunnableConfig) -> str:
+    return config["configurable"].get("checkpoint_ns", "")
+
+
+class DeferredCheckpointer(BaseCheckpointSaver):
+    """Envuelve un checkpointer y difiere las escrituras de subgrafos hasta el fin del workflow.
+
+    Args:
+        saver: Checkpointer real (Postgres, memoria, ...).
+        deferred: Si es False, todas las llamadas se delegan directamente (útil en desarrollo).
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, deferred: bool = True) -> None:
+        """Envuelve `saver`; con `deferred=False` sólo delega."""
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.deferred = deferred
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, _PendingNamespace]] = defaultdict(dict)
+
+    # ---- buffer ---------------------------------------------------------
+
+    def _should_defer(self, config: RunnableConfig) -> bool:
+        return self.deferred and _checkpoint_ns(config) != ""
+
+    def _buffer_put(self, config: RunnableConfig, checkpoint: Checkpoint,
+                    metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id, ns = _thread_id(config), _checkpoint_ns(config)
+        with self._lock:
+            pending = self._pending[thread_id].get(ns)
+            if pending is None or pending.checkpoint is None:
+                pending = _PendingNamespace(config=config)
+                self._pending[thread_id][ns] = pending
+            pending.checkpoint = copy_checkpoint(checkpoint)
+            pending.metadata = metadata
+            pending.new_versions.update(new_versions)
+            # Las escrituras de pasos anteriores ya están incluidas en este checkpoint
+            pending.writes = []
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _buffer_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]],
+                       task_id: str, task_path: str) -> None:
+        thread_id, ns = _thread_id(config), _checkpoint_ns(config)
+        with self._lock:
+            pending = self._pending[thread_id].setdefault(ns, _PendingNamespace(config=config))
+            pending.writes.append((config, writes, task_id, task_path))
+
+    def _peek(self, config: RunnableConfig) -> Tuple[bool, Optional[CheckpointTuple]]:
+        """Devuelve (hay_pendientes_en_el_thread, tupla_servible_desde_memoria)."""
+        thread_id, ns = _thread_id(config), _checkpoint_ns(config)
+        with self._lock:
+            namespaces = self._pending.get(thread_id)
+            if not namespaces:
+                return False, None
+            pending = namespaces.get(ns)
+            if pending is None or pending.checkpoint is None:
+                return True, None
+            checkpoint_id = config["configurable"].get("checkpoint_id")
+            if checkpoint_id and checkpoint_id != pending.checkpoint["id"]:
+                return True, None
+            parent_id = pending.config["configurable"].get("checkpoint_id")
+            return True, CheckpointTuple(
+                config={
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": ns,
+                        "checkpoint_id": pending.checkpoint["id"],
+                    }
+                },
+                checkpoint=copy_checkpoint(pending.checkpoint),
+                metadata=pending.metadata,
+                parent_config=pending.config if parent_id else None,
+                pending_writes=[
+                    (task_id, channel, value)
+                    for _, writes, task_id, _ in pending.writes
+                    for channel, value in writes
+                ],
+            )
+
+    def _drain(self, thread_id: Optional[str]) -> List[_PendingNamespace]:
+        with self._lock:
+            threads = [thread_id] if thread_id is not None else list(self._pending)
+            return [
+                pending
+                for t in threads
+                for pending in self._pending.pop(t, {}).values()
+            ]
+
+    def flush(self, thread_id: Optional[str] = None) -> None:
+        """Vuelca al checkpointer real el último estado diferido de `thread_id` (o de todos los threads)."""
+        for pending in self._drain(thread_id):
+            if pending.checkpoint is not None:
+                self.saver.put(pending.config, pending.checkpoint, pending.metadata, pending.new_versions)
+            for write in pending.writes:
+                self.saver.put_writes(*write)
+
+    async def aflush(self, thread_id: Optional[str] = None) -> None:
+        """Versión asíncrona de `flush`."""
+        for pending in self._drain(thread_id):
+            if pending.checkpoint is not None:
+                await self.saver.aput(pending.config, pending.checkpoint, pending.metadata, pending.new_versions)
+            for write in pending.writes:
+                await self.saver.aput_writes(*write)
+
+    # ---- BaseCheckpointSaver (sync) ---------------------------------------
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Sirve el checkpoint diferido desde memoria, o vuelca lo pendiente y delega."""
+        if self.deferred:
+            has_pending, buffered = self._peek(config)
+            if buffered is not None:
+                return buffered
+            if has_pending:
+                self.flush(_thread_id(config))
+        return self.saver.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Vuelca lo pendiente (del thread o de todos) y delega el listado."""
+        self.flush(_thread_id(config) if config else None)
+        return self.saver.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint,
+            metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        """Difiere los checkpoints de subgrafos; uno raíz vuelca antes lo pendiente."""
+        if self._should_defer(config):
+            return self._buffer_put(config, checkpoint, metadata, new_versions)
+        # Un checkpoint raíz marca el fin (o inicio) del workflow: volcar subgrafos primero
+        self.flush(_thread_id(config))
+        return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]],
+                   task_id: str, task_path: str = "") -> None:
+        """Difiere las escrituras de subgrafos; las del namespace raíz se delegan."""
+        if self._should_defer(config):
+            return self._buffer_writes(config, writes, task_id, task_path)
+        return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Descarta lo pendiente del thread y lo borra del checkpointer real."""
+        with self._lock:
+            self._pending.pop(str(thread_id), None)
+        return self.saver.delete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        """Delega el versionado de canales en el checkpointer real."""
+        return self.saver.get_next_version(current, channel)
+
+    # ---- BaseCheckpointSaver (async) --------------------------------------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Versión asíncrona de `get_tuple`."""
+        if self.deferred:
+            has_pending, buffered = self._peek(config)
+            if buffered is not None:
+                return buffered
+            if has_pending:
+                await self.aflush(_thread_id(config))
+        return await self.saver.aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Versión asíncrona de `list`."""
+        await self.aflush(_thread_id(config) if config else None)
+        async for item in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint,
+                   metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        """Versión asíncrona de `put`."""
+        if self._should_defer(config):
+            return self._buffer_put(config, checkpoint, metadata, new_versions)
+        await self.aflush(_thread_id(config))
+        return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]],
+                          task_id: str, task_path: str = "") -> None:
+        """Versión asíncrona de `put_writes`."""
+        if self._should_defer(config):
+            return self._buffer_writes(config, writes, task_id, task_path)
+        return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Versión asíncrona de `delete_thread`."""
+        with self._lock:
+            self._pending.pop(str(thread_id), None)
+        return await self.saver.adelete_thread(thread_id)
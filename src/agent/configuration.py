@@ -1,69 +1,129 @@
 import os
 from enum import Enum
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, Optional
 
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY es obligatoria")
-
-# URL de Postgres para MCP
-POSTGRES_URI = os.getenv("POSTGRES_URI")
-if not POSTGRES_URI:
-    raise ValueError("POSTGRES_URL es obligatoria para MCP-Postgres")
 
 class ModelType(str, Enum):
     MANAGER     = "manager"
     SPECIALIZED = "specialized"
     GUARDRAIL   = "guardrail"
 
-CONFIG: Dict[str, Any] = {
-    "models": {
-        ModelType.MANAGER:     os.getenv("MODEL_MANAGER",     "gpt-4o"),
-        ModelType.SPECIALIZED: os.getenv("MODEL_SPECIALIZED", "gpt-4o-mini"),
-        ModelType.GUARDRAIL:   os.getenv("MODEL_GUARDRAIL",   "gpt-4o-mini"),
-    },
-    "guardrails": {
-        "max_input_length": 500,
-        "max_input_length_per_guardrail": {
-            "Relevance Guardrail": 300,
-            "Security Guardrail": 400,
+
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    """Carga `.env` una sola vez, antes de la primera lectura de cualquier variable."""
+    load_dotenv()
+
+
+def get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Lee una variable de entorno garantizando que `.env` ya fue cargado."""
+    _load_env()
+    return os.getenv(name, default)
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """Interruptor on/off de entorno ("1" = activado)."""
+    return get_env(name, "1" if default else "0") == "1"
+
+
+@lru_cache(maxsize=1)
+def _get_config() -> Dict[str, Any]:
+    """Carga el entorno y construye la configuración una sola vez, al primer acceso."""
+    _load_env()
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        raise ValueError("OPENAI_API_KEY es obligatoria")
+
+    # URL de Postgres para MCP
+    postgres_uri = os.getenv("POSTGRES_URI")
+    if not postgres_uri:
+        raise ValueError("POSTGRES_URL es obligatoria para MCP-Postgres")
+
+    config: Dict[str, Any] = {
+        "models": {
+            ModelType.MANAGER:     os.getenv("MODEL_MANAGER",     "gpt-4o"),
+            ModelType.SPECIALIZED: os.getenv("MODEL_SPECIALIZED", "gpt-4o-mini"),
+            ModelType.GUARDRAIL:   os.getenv("MODEL_GUARDRAIL",   "gpt-4o-mini"),
+        },
+        "guardrails": {
+            "max_input_length": 500,
+            "max_input_length_per_guardrail": {
+                "Relevance Guardrail": 300,
+                "Security Guardrail": 400,
+            },
+            "cache_ttl": 300
+        },
+        "runtime": {
+            "max_retries": 3,
         },
-        "cache_ttl": 300
-    },
-    "runtime": {
-        "max_retries": 3,
-    },
-    "session": {
-        "ttl": int(os.getenv("SESSION_TTL", "3600"))
-    },
-    # Nueva sección MCP
-    "mcp": {
-        "servers": {
-            "postgres": {
-                # Usamos el paquete oficial de MCP-Postgres via NPX
-                "command": os.getenv("MCP_PG_COMMAND", "npx"),
-                "args": [
-                    "-y",
-                    "@modelcontextprotocol/server-postgres",
-                    POSTGRES_URI,
-                    # Opcional: puedes añadir flags de esquema/tablas admitidas si el servidor los soporta
-                    "--schema=public",
-                    "--tables=bd_all_projects,bd_project_units,bd_all_images_project"
-                ],
-                "transport": "stdio"
+        "session": {
+            "ttl": int(os.getenv("SESSION_TTL", "3600"))
+        },
+        # Nueva sección MCP
+        "mcp": {
+            "servers": {
+                "postgres": {
+                    # Usamos el paquete oficial de MCP-Postgres via NPX
+                    "command": os.getenv("MCP_PG_COMMAND", "npx"),
+                    "args": [
+                        "-y",
+                        "@modelcontextprotocol/server-postgres",
+                        postgres_uri,
+                        # Opcional: puedes añadir flags de esquema/tablas admitidas si el servidor los soporta
+                        "--schema=public",
+                        "--tables=bd_all_projects,bd_project_units,bd_all_images_project"
+                    ],
+                    "transport": "stdio"
+                }
             }
         }
     }
-}
 
+    return {
+        "OPENAI_API_KEY": openai_api_key,
+        "POSTGRES_URI": postgres_uri,
+        "CONFIG": config,
+    }
+
+
+_LAZY_SETTINGS = ("OPENAI_API_KEY", "POSTGRES_URI", "CONFIG")
+
+
+def __getattr__(name: str) -> Any:
+    """Expone OPENAI_API_KEY, POSTGRES_URI y CONFIG de forma perezosa (PEP 562)."""
+    if name in _LAZY_SETTINGS:
+        return _get_config()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Un único pool HTTP/2 con keep-alive compartido por supervisor, agentes y guardrails
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
+
+@lru_cache(maxsize=1)
+def get_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
+
+@lru_cache(maxsize=8)
 def get_model(model_type: ModelType) -> ChatOpenAI:
+    settings = _get_config()
     return ChatOpenAI(
-        model=CONFIG["models"][model_type],
+        model=settings["CONFIG"]["models"][model_type],
         temperature=0.7,
-        api_key=OPENAI_API_KEY
-    )
\ No newline at end of file
+        api_key=settings["OPENAI_API_KEY"],
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
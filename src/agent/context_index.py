@@ -0,0 +1,165 @@
+# src/agent/context_index.py
+"""Índice de resúmenes del historial (select-then-hydrate).
+
+Tras cada turno, `index_turn` resume en ≤3 frases los mensajes antiguos aún no
+indexados y los guarda en `state["context"]["msg_index"]`. Cuando el historial
+excede el presupuesto de tokens, `select_messages` pide al modelo barato
+(GUARDRAIL) qué mensajes antiguos son relevantes para la consulta actual y sólo
+esos se hidratan con su contenido completo, junto con los últimos turnos.
+
+Las claves del índice son un hash de (rol, contenido): el cliente reenvía el
+historial en cada petición y los IDs de mensaje cambian entre peticiones, así
+que el índice se reconoce igual en el turno siguiente. app.py lo arrastra
+entre turnos desde el valor previo del entrypoint.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+import orjson
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from src.agent.configuration import ModelType, get_model
+
+logger = logging.getLogger("context_index")
+
+# Turnos recientes que siempre se envían completos (y que aún no se indexan)
+RECENT_TURNS = 2
+# Por debajo de este tamaño el recorte lineal nunca descarta nada: no se indexa
+INDEX_MIN_TOKENS = 1750
+# Tope de entradas del índice por sesión (se descartan las más antiguas)
+INDEX_MAXLEN = 500
+
+INDEX_PROMPT = """
+Resume cada mensaje de una conversación inmobiliaria en máximo 3 frases,
+conservando datos concretos (zonas, precios, habitaciones, proyectos, datos del cliente).
+Recibirás una lista JSON de objetos {"id", "role", "content"}.
+Responde sólo con un objeto JSON:
+{
+  "summaries": {"<id>": "<resumen>", ...}
+}
+"""
+
+SELECT_PROMPT = """
+Eres un bibliotecario de contexto. Recibirás un índice de mensajes previos
+(id: resumen) y la consulta actual del usuario. Elige sólo los mensajes cuyo
+contenido completo es necesario para responder la consulta.
+Responde sólo con un objeto JSON:
+{
+  "ids": ["<id>", ...]
+}
+"""
+
+# Fallos esperables del modelo barato: API/red o una respuesta que no es JSON
+_MODEL_ERRORS = (openai.OpenAIError, httpx.HTTPError, orjson.JSONDecodeError)
+
+
+def _ask_json(prompt: str, content: str) -> Dict[str, Any]:
+    """Consulta al modelo GUARDRAIL y devuelve su respuesta como objeto JSON ({} si no lo es)."""
+    model = get_model(ModelType.GUARDRAIL)
+    response = model.invoke([
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": content}
+    ])
+    payload = orjson.loads(response.content)
+    return payload if isinstance(payload, dict) else {}
+
+
+def _is_indexable(message: Any) -> bool:
+    """Sólo mensajes humanos y respuestas finales: hidratarlos no rompe pares tool_call/tool."""
+    if isinstance(message, HumanMessage):
+        return isinstance(message.content, str)
+    if isinstance(message, AIMessage):
+        return isinstance(message.content, str) and not message.tool_calls
+    return False
+
+
+def message_key(message: Any) -> str:
+    """Clave estable entre peticiones: hash de rol + contenido."""
+    digest = hashlib.blake2b(f"{message.type}\0{message.content}".encode(), digest_size=8)
+    return digest.hexdigest()
+
+
+def _recent_start(messages: List[Any], turns: int = RECENT_TURNS) -> int:
+    """Índice donde empiezan los últimos `turns` turnos (desde el n-ésimo HumanMessage final)."""
+    seen = 0
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            seen += 1
+            if seen == turns:
+                return i
+    return 0
+
+
+def index_turn(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Nodo post-respuesta: resume los mensajes antiguos aún no indexados del historial.
+
+    Sólo llama al LLM cuando el historial se acerca al presupuesto y hay mensajes
+    nuevos fuera de los turnos recientes; el resto de los turnos no cuesta nada.
+    """
+    messages = state.get("messages", [])
+    if count_tokens_approximately(messages) <= INDEX_MIN_TOKENS:
+        return {}
+
+    context = state.get("context") or {}
+    msg_index: Dict[str, str] = dict(context.get("msg_index", {}))
+
+    pending: Dict[str, Dict[str, Any]] = {}
+    for m in messages[:_recent_start(messages)]:
+        if _is_indexable(m):
+            key = message_key(m)
+            if key not in msg_index:
+                pending[key] = {"id": key, "role": m.type, "content": m.content}
+    if not pending:
+        return {}
+
+    try:
+        summaries = _ask_json(INDEX_PROMPT, orjson.dumps(list(pending.values())).decode()).get("summaries")
+    except _MODEL_ERRORS:
+        # El índice es una optimización: si falla, el recorte lineal sigue funcionando
+        logger.warning("No se pudo indexar el historial; se mantiene el recorte lineal", exc_info=True)
+        return {}
+    if not isinstance(summaries, dict):
+        return {}
+
+    msg_index.update({k: v for k, v in summaries.items() if k in pending and isinstance(v, str)})
+    # dict conserva el orden de inserción: se descartan las entradas más antiguas
+    for stale in list(msg_index)[:max(0, len(msg_index) - INDEX_MAXLEN)]:
+        del msg_index[stale]
+
+    return {"context": {**context, "msg_index": msg_index}}
+
+
+def select_messages(messages: List[Any], msg_index: Dict[str, str]) -> Optional[List[Any]]:
+    """Selecciona mensajes antiguos relevantes vía índice y los hidrata junto a los turnos recientes.
+
+    Returns:
+        Lista de mensajes a enviar al LLM, o None si no hay índice utilizable.
+    """
+    start = _recent_start(messages)
+    older, recent = messages[:start], messages[start:]
+    candidates = {}
+    for m in older:
+        if _is_indexable(m):
+            key = message_key(m)
+            if key in msg_index:
+                candidates.setdefault(key, m)
+    if not candidates or not recent:
+        return None
+
+    query = next((m.content for m in reversed(recent) if isinstance(m, HumanMessage)), "")
+    index_text = "\n".join(f"{key}: {msg_index[key]}" for key in candidates)
+
+    try:
+        ids = _ask_json(SELECT_PROMPT, f"ÍNDICE:\n{index_text}\n\nCONSULTA ACTUAL:\n{query}").get("ids")
+    except _MODEL_ERRORS:
+        logger.warning("No se pudo seleccionar contexto desde el índice", exc_info=True)
+        return None
+    if not isinstance(ids, list):
+        return None
+    selected = {i for i in ids if isinstance(i, str)}
+
+    return [m for key, m in candidates.items() if key in selected] + recent
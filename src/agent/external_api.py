@@ -1,68 +1,131 @@
 # external_api.py - Simulación de API externa para el CRM
+import itertools
 import logging
-import random
+import threading
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from src.agent import configuration
+
+
+@dataclass(slots=True)
+class LeadRecord:
+    """Registro de un lead en la base simulada (slots: menos memoria, acceso directo)."""
+    data: Dict[str, Any]
+    stage: str
+    created_at: str
+    updated_at: str
 
 
 class CRMApi:
     """Simulación de API externa para comunicación con el CRM."""
 
-    def __init__(self):
-        self.leads_db = {}  # Simulación de base de datos
-        self.logger = logging.getLogger("crm_api")
+    logger = logging.getLogger("crm_api")
+
+    def __init__(self, ttl: Optional[float] = None):
+        """Crea el cliente; `ttl=None` usa el TTL de sesión de CONFIG, leído al primer uso."""
+        self._ttl = ttl
+        self._leads_db: Optional[TTLCache] = None
+        # TTLCache no es thread-safe, todo acceso pasa por self._lock.
+        self._lock = threading.RLock()
+        # Contador atómico bajo el GIL: IDs únicos por proceso, sin colisiones
+        self._id_counter = itertools.count(10000)
+
+    @property
+    def leads_db(self) -> TTLCache:
+        """Simulación de base de datos: expira con el TTL de sesión y acota la memoria."""
+        if self._leads_db is None:
+            with self._lock:
+                if self._leads_db is None:
+                    ttl = self._ttl if self._ttl is not None else configuration.CONFIG["session"]["ttl"]
+                    self._leads_db = TTLCache(maxsize=100_000, ttl=ttl)
+        return self._leads_db
 
     def register_prelead(self, prelead_data: Dict[str, Any]) -> str:
         """Registra un prelead en el CRM."""
-        lead_id = f"L{random.randint(10000, 99999)}"
-        self.leads_db[lead_id] = {
-            "data": prelead_data,
-            "stage": "prelead",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-        self.logger.info(f"Prelead registrado: {lead_id}")
+        lead_id = f"L{next(self._id_counter)}"
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.leads_db[lead_id] = LeadRecord(prelead_data, "prelead", now, now)
+        self.logger.info("Prelead registrado: %s", lead_id)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Campos del prelead %s: %s", lead_id, sorted(prelead_data))
         return lead_id
 
     def update_lead(self, lead_id: str, lead_data: Dict[str, Any]) -> bool:
         """Actualiza un lead existente a estado completo."""
-        if lead_id not in self.leads_db:
-            self.logger.error(f"Lead ID no encontrado: {lead_id}")
-            return False
-
-        self.leads_db[lead_id].update({
-            "data": lead_data,
-            "stage": "lead",
-            "updated_at": datetime.now().isoformat()
-        })
-        self.logger.info(f"Lead actualizado: {lead_id}")
+        with self._lock:
+            lead = self.leads_db.get(lead_id)
+            if lead is None:
+                self.logger.error("Lead ID no encontrado: %s", lead_id)
+                return False
+
+            lead.data = lead_data
+            lead.stage = "lead"
+            lead.updated_at = datetime.now().isoformat()
+            # Reinsertar: TTLCache mide la expiración desde la inserción
+            self.leads_db[lead_id] = lead
+        self.logger.info("Lead actualizado: %s", lead_id)
         return True
 
     def enrich_lead(self, lead_id: str, enriched_data: Dict[str, Any]) -> bool:
         """Enriquece un lead con datos adicionales."""
-        if lead_id not in self.leads_db:
-            self.logger.error(f"Lead ID no encontrado: {lead_id}")
-            return False
-
-        self.leads_db[lead_id].update({
-            "data": enriched_data,
-            "stage": "enriched_lead",
-            "updated_at": datetime.now().isoformat()
-        })
-        self.logger.info(f"Lead enriquecido: {lead_id}")
+        with self._lock:
+            lead = self.leads_db.get(lead_id)
+            if lead is None:
+                self.logger.error("Lead ID no encontrado: %s", lead_id)
+                return False
+
+            lead.data = enriched_data
+            lead.stage = "enriched_lead"
+            lead.updated_at = datetime.now().isoformat()
+            # Reinsertar: TTLCache mide la expiración desde la inserción
+            self.leads_db[lead_id] = lead
+        self.logger.info("Lead enriquecido: %s", lead_id)
         return True
 
+    def upsert_lead(self, lead_id: Optional[str], stage: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Crea (lead_id=None) o actualiza un lead en una sola operación.
+
+        El payload se fusiona con los datos ya registrados, así cada etapa
+        (prelead → lead → enriched_lead) envía sólo sus campos nuevos.
+        Devuelve el lead_id, o None si el lead a actualizar no existe.
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            if lead_id is None:
+                lead_id = f"L{next(self._id_counter)}"
+                self.leads_db[lead_id] = LeadRecord(dict(payload), stage, now, now)
+            else:
+                lead = self.leads_db.get(lead_id)
+                if lead is None:
+                    self.logger.error("Lead ID no encontrado: %s", lead_id)
+                    return None
+                lead.data.update(payload)
+                lead.stage = stage
+                lead.updated_at = now
+                # Reinsertar renueva el TTL: un lead activo no expira a mitad del flujo
+                self.leads_db[lead_id] = lead
+        self.logger.info("Lead %s en etapa %s", lead_id, stage)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Campos enviados para %s: %s", lead_id, sorted(payload))
+        return lead_id
+
     def get_lead_status(self, lead_id: str) -> Dict[str, Any]:
         """Obtiene el estado actual de un lead."""
-        if lead_id not in self.leads_db:
+        with self._lock:
+            lead = self.leads_db.get(lead_id)
+        if lead is None:
             return {"error": "Lead no encontrado"}
 
-        lead = self.leads_db[lead_id]
         return {
             "lead_id": lead_id,
-            "stage": lead["stage"],
-            "created_at": lead["created_at"],
-            "updated_at": lead["updated_at"]
+            "stage": lead.stage,
+            "created_at": lead.created_at,
+            "updated_at": lead.updated_at
         }
 
 
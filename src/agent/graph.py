@@ -1,18 +1,27 @@
 # src/agent/graph.py
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Any, List, Optional, Tuple
 
 from langchain_core.globals import set_debug, set_verbose
 from langchain_core.messages.utils import count_tokens_approximately, trim_messages
-from langgraph.constants import START
 from langgraph.graph import END, StateGraph
 from langgraph.prebuilt import create_react_agent
+from langgraph_supervisor import create_supervisor
 
-from src.agent.configuration import ModelType, get_model
+from src.agent.configuration import ModelType, env_flag, get_model
+from src.agent.context_index import index_turn, select_messages
 from src.agent.guardrails import add_guardrails_to_graph
 from src.agent.memory_setup import checkpointer, store
 from src.agent.prompts import CAPTURA_PROMPT, FILTRADO_PROMPT, SUPERVISOR_PROMPT
-from src.agent.state import InmobiliaState
+from src.agent.state import INTERACTION_HISTORY_MAXLEN, InmobiliaState
 from src.agent.tools import (
+    classify_distrito,
     enrich_lead,
+    query_project_bundle,
     query_project_detail,
     query_project_images,
     query_similar_units,
@@ -26,110 +35,229 @@ from src.agent.tools import (
     validate_customer_data,
 )
 
-set_debug(True)
-set_verbose(False)
+logger = logging.getLogger("graph")
+
+
+def _configure_logging() -> None:
+    """Activa el debug de LangChain sólo con LANGCHAIN_DEBUG=1 (vuelca cada prompt/respuesta)."""
+    set_debug(env_flag("LANGCHAIN_DEBUG", False))
+    set_verbose(False)
+
 
 # 1) Pre-model hook para recortar el historial si crece demasiado
+# Cache LRU del recorte: el supervisor re-enruta con el mismo historial varias
+# veces por turno, así que evitamos recontar tokens de todo el historial.
+_MAX_INPUT_TOKENS = 3500
+_TRIM_CACHE_SIZE = 128
+_TRIM_CACHE_TAIL = 8
+_trim_cache: "OrderedDict[Tuple[Any, ...], List[Any]]" = OrderedDict()
+_trim_cache_lock = threading.Lock()
+
+
+# Roles OpenAI que usa `count_tokens_approximately` (m.type → rol)
+_FAST_COUNT_ROLES = {"human": "user", "ai": "assistant"}
+
+
+def _fast_token_count(messages: List[Any]) -> int:
+    """Conteo aproximado (~4 caracteres/token) con atajo para mensajes de texto plano.
+
+    Misma aritmética por mensaje que `count_tokens_approximately`: ceil((contenido +
+    rol OpenAI + name) / 4) + 3. Sólo toma el atajo para mensajes humanos y de IA
+    con contenido str y sin tool_calls; el resto (system, tool, multimodal) cae
+    en la función original, mensaje a mensaje. Con versiones de langchain-core
+    que redondean una sola vez sobre el total, este conteo puede superar al
+    original en menos de 1 token por mensaje (recorte ligeramente más conservador).
+    """
+    total = 0
+    for m in messages:
+        content = getattr(m, "content", None)
+        role = _FAST_COUNT_ROLES.get(getattr(m, "type", None))
+        if role is not None and isinstance(content, str) and not getattr(m, "tool_calls", None):
+            chars = len(content) + len(role) + len(m.name or "")
+            total += -(-chars // 4) + 3
+        else:
+            total += count_tokens_approximately([m])
+    return total
+
+
+def _trim_cache_key(messages: List[Any]) -> Optional[Tuple[Any, ...]]:
+    """Clave = largo del historial + IDs de los últimos mensajes (None si falta algún ID)."""
+    tail_ids = tuple(getattr(m, "id", None) for m in messages[-_TRIM_CACHE_TAIL:])
+    if None in tail_ids:
+        return None
+    return (len(messages), tail_ids)
+
+
 def pre_model_trim(state):
+    """Pre-model hook: recorta el historial al presupuesto de tokens antes de cada llamada al LLM."""
+    messages = state["messages"]
+    key = _trim_cache_key(messages)
+    if key is not None:
+        with _trim_cache_lock:
+            cached = _trim_cache.get(key)
+            if cached is not None:
+                _trim_cache.move_to_end(key)
+                return {"llm_input_messages": list(cached)}
+
+    # Select-then-hydrate: si el historial excede el presupuesto y hay índice,
+    # sólo se hidratan los mensajes antiguos relevantes + los turnos recientes
+    msg_index = (state.get("context") or {}).get("msg_index")
+    if msg_index and _fast_token_count(messages) > _MAX_INPUT_TOKENS:
+        selected = select_messages(messages, msg_index)
+        if selected is not None:
+            messages = selected
+
     trimmed = trim_messages(
-        state["messages"],
+        messages,
         strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=3500,
+        token_counter=_fast_token_count,
+        max_tokens=_MAX_INPUT_TOKENS,
         start_on="human",
         end_on=("human", "tool"),
     )
-    return {"llm_input_messages": trimmed}
+
+    if key is not None:
+        with _trim_cache_lock:
+            _trim_cache[key] = trimmed
+            if len(_trim_cache) > _TRIM_CACHE_SIZE:
+                _trim_cache.popitem(last=False)
+    return {"llm_input_messages": list(trimmed)}
+
+
+# Plantilla con los escalares por defecto; los contenedores se crean por llamada
+_INITIAL_TEMPLATE = InmobiliaState(
+    consent_obtained=False,
+    lead_registrado=False,
+    properties_shown=False,
+    interaction_count=0
+)
+
 
 def create_initial_state():
     """Crea un estado inicial con todos los valores por defecto."""
-    return InmobiliaState(
-        consent_obtained=False,
-        lead_registrado=False,
-        user_data={},
-        preferencias={},
-        interaction_history=[],
-        context={},
-        guardrail_cache={},
-        properties_shown=False,
-        interaction_count=0
-    )
+    # Copia superficial + contenedores mutables nuevos para no compartirlos entre sesiones
+    return {
+        **_INITIAL_TEMPLATE,
+        "user_data": {},
+        "preferencias": {},
+        "interaction_history": deque(maxlen=INTERACTION_HISTORY_MAXLEN),
+        "context": {},
+        "guardrail_cache": {},
+    }
 
 # 2) Crear los agentes con las herramientas específicas para cada uno
-filtrado_agent = create_react_agent(
-    name="filtrado_agent",
-    model=get_model(ModelType.SPECIALIZED),
-    # Este agente es especialista en búsqueda de propiedades
-    tools=[
-        sql_query_units,  # Búsqueda general
-        query_project_detail,  # Ver detalles de un proyecto
-        query_units_by_project,  # Ver unidades de un proyecto
-        query_project_images,  # Ver imágenes de un proyecto
-        query_similar_units  # Encontrar unidades similares
-    ],
-    prompt=FILTRADO_PROMPT,
-    state_schema=InmobiliaState,
-    checkpointer=checkpointer,
-    store=store,
-    pre_model_hook=pre_model_trim,
-)
+_AGENT_SPECS = (
+    {
+        "name": "filtrado_agent",
+        # Este agente es especialista en búsqueda de propiedades
+        "tools": [
+            sql_query_units,  # Búsqueda general
+            query_project_detail,  # Ver detalles de un proyecto
+            query_units_by_project,  # Ver unidades de un proyecto
+            query_project_images,  # Ver imágenes de un proyecto
+            query_project_bundle,  # Detalle + imágenes + unidades en una llamada
+            query_similar_units,  # Encontrar unidades similares
+            classify_distrito  # Distrito → código de zona
+        ],
+        "prompt": FILTRADO_PROMPT,
+    },
+    {
+        "name": "captura_agent",
+        # Este agente se enfoca en captura de datos y CRM, pero también puede
+        # mostrar propiedades específicas si es necesario
+        "tools": [
+            # Herramientas CRM
+            validate_customer_data,
+            register_prelead,
+            register_lead,
+            enrich_lead,
+            register_property_interest,
 
-captura_agent = create_react_agent(
-    name="captura_agent",
-    model=get_model(ModelType.SPECIALIZED),
-    # Este agente se enfoca en captura de datos y CRM, pero también puede
-    # mostrar propiedades específicas si es necesario
-    tools=[
-        # Herramientas CRM
-        validate_customer_data,
-        register_prelead,
-        register_lead,
-        enrich_lead,
-        register_property_interest,
-
-        # Acceso limitado a propiedades
-        sql_query_units  # Búsqueda general
-    ],
-    prompt=CAPTURA_PROMPT,
-    state_schema=InmobiliaState,
-    checkpointer=checkpointer,
-    store=store,
-    pre_model_hook=pre_model_trim,
+            # Acceso limitado a propiedades
+            sql_query_units,  # Búsqueda general
+            classify_distrito  # Distrito → código de zona
+        ],
+        "prompt": CAPTURA_PROMPT,
+    },
 )
 
-# 3) Crear el supervisor multiagente
-from langgraph_supervisor import create_supervisor
 
-supervisor_agent = create_supervisor(
-    agents=[filtrado_agent, captura_agent],
-    model=get_model(ModelType.MANAGER),
-    prompt=SUPERVISOR_PROMPT,
-    state_schema=InmobiliaState,
-    output_mode="last_message",
-    add_handoff_messages=True,
-    supervisor_name="supervisor_inmobiliario",
-    include_agent_name="inline"
-).compile()
+def _build_agent(spec):
+    return create_react_agent(
+        name=spec["name"],
+        model=get_model(ModelType.SPECIALIZED),
+        tools=spec["tools"],
+        prompt=spec["prompt"],
+        state_schema=InmobiliaState,
+        checkpointer=checkpointer,
+        store=store,
+        pre_model_hook=pre_model_trim,
+    )
+
+
+def _build_agents():
+    """Construye los agentes en paralelo (binding de tools e introspección de schemas)."""
+    # Calentar el modelo antes: lru_cache no evita construcciones duplicadas entre hilos
+    get_model(ModelType.SPECIALIZED)
+    with ThreadPoolExecutor(max_workers=len(_AGENT_SPECS)) as executor:
+        return list(executor.map(_build_agent, _AGENT_SPECS))
+
+
+# 3) Crear el supervisor multiagente (se compila al primer uso, no al importar)
+@cache
+def get_supervisor():
+    """Construye y compila una única vez el supervisor con sus agentes."""
+    return create_supervisor(
+        agents=_build_agents(),
+        model=get_model(ModelType.MANAGER),
+        prompt=SUPERVISOR_PROMPT,
+        state_schema=InmobiliaState,
+        output_mode="last_message",
+        add_handoff_messages=True,
+        supervisor_name="supervisor_inmobiliario",
+        include_agent_name="inline"
+    ).compile()
+
 
 # 4) Armar el StateGraph con guardrails y supervisor
-workflow = StateGraph(InmobiliaState)
-# Añade nodos y transiciones de guardrails
-workflow = add_guardrails_to_graph(workflow)
-
-# Nodo central del supervisor
-workflow.add_node("agent_supervisor", supervisor_agent)
-# Conecta guardrails → supervisor → siguiente guardrail → ...
-# Agregar conexión desde START al primer guardrail
-workflow.add_edge(START, "relevance_check")
-workflow.add_edge("consent_check", "agent_supervisor")
-workflow.add_edge("agent_supervisor", "pii_check")
-workflow.add_edge("generate_guardrail_response", END)
-
-# 5) Compilar el grafo
-graph = workflow.compile()
-
-# Eliminar la invocación directa para que no se ejecute durante la importación
-# result = graph.invoke(create_initial_state())  <- Esta línea se elimina
-
-# Exportar componentes necesarios
-__all__ = ["graph", "workflow", "create_initial_state"]
\ No newline at end of file
+@cache
+def get_workflow():
+    """Construye y compila una única vez el workflow completo (guardrails + supervisor)."""
+    workflow = StateGraph(InmobiliaState)
+    # Añade nodos y transiciones de guardrails; ambas salidas pasan por el indexador
+    workflow = add_guardrails_to_graph(
+        workflow,
+        exit_node="index_turn",
+        fused=env_flag("GUARDRAILS_FUSED", True),
+    )
+
+    # Nodo central del supervisor
+    workflow.add_node("agent_supervisor", get_supervisor())
+    # Conecta supervisor → guardrails de salida (la entrada ya parte de START)
+    workflow.add_edge("agent_supervisor", "guardrails_post")
+    # Indexa el turno (resúmenes para select-then-hydrate) antes de terminar
+    workflow.add_node("index_turn", index_turn)
+    workflow.add_edge("index_turn", END)
+
+    # 5) Compilar el grafo (la invocación ocurre sólo desde el entrypoint de app.py)
+    return workflow.compile()
+
+
+def __getattr__(name: str):
+    """Mantiene `from src.agent.graph import workflow/graph` compilando de forma perezosa (PEP 562)."""
+    if name in ("workflow", "graph"):
+        return get_workflow()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Exportar componentes necesarios ("graph" y "workflow" los resuelve `__getattr__`)
+__all__ = ["graph", "workflow", "get_workflow", "get_supervisor", "create_initial_state"]  # noqa: F822
+
+
+if __name__ == "__main__":
+    # Smoke test manual: `python -m src.agent.graph` (nunca se ejecuta al importar)
+    logging.basicConfig(level=logging.INFO)
+    _configure_logging()
+    smoke_state = create_initial_state()
+    smoke_state["messages"] = [{"role": "user", "content": "Hola, busco un departamento en Miraflores"}]
+    logger.info("%s", get_workflow().invoke(smoke_state))
@@ -1,26 +1,74 @@
 # src/agent/mcp_setup.py
 import asyncio
+import atexit
+import threading
+from typing import Any, Coroutine, Dict, Optional, Tuple
 
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
 from src.agent.configuration import CONFIG
 
+# Las sesiones stdio de MCP quedan ligadas al loop que las abrió: se usa un único
+# loop persistente en un hilo de fondo, en lugar de get_event_loop() (deprecado
+# fuera de un loop en 3.10+) o asyncio.run (que cerraría el loop y las sesiones).
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[Tuple[MultiServerMCPClient, Dict[str, Any], Any]] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        threading.Thread(target=_loop.run_forever, name="mcp-loop", daemon=True).start()
+    return _loop
 
-def setup_mcp_client():
-    """Configura y devuelve un cliente MCP y sus herramientas usando la configuración existente."""
-    # Usar la configuración existente
-    mcp_conf = CONFIG["mcp"]["servers"]
 
-    # Inicializar el cliente MCP
-    mcp_client = MultiServerMCPClient(mcp_conf)
+def run_mcp(coro: Coroutine) -> Any:
+    """Ejecuta una corrutina MCP (p. ej. `query_tool.ainvoke(...)`) en el loop de las sesiones."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+async def _init() -> Tuple[MultiServerMCPClient, Dict[str, Any], Any]:
+    # Usar la configuración existente
+    mcp_client = MultiServerMCPClient(CONFIG["mcp"]["servers"])
 
     # Entrar en context manager para que el cliente quede listo
-    asyncio.get_event_loop().run_until_complete(mcp_client.__aenter__())
+    await mcp_client.__aenter__()
+
+    # Recuperar herramientas indexadas por nombre (lookup O(1) para los consumidores)
+    tools_by_name = {t.name: t for t in mcp_client.get_tools()}
+
+    return mcp_client, tools_by_name, tools_by_name["query"]
+
+
+def _shutdown() -> None:
+    """Cierra sesiones y subproceso MCP en su loop y detiene el hilo."""
+    if _client is None or _loop is None:
+        return
+    try:
+        run_mcp(_client[0].__aexit__(None, None, None))
+    finally:
+        _loop.call_soon_threadsafe(_loop.stop)
+
+
+def setup_mcp_client():
+    """Configura y devuelve un cliente MCP y sus herramientas usando la configuración existente.
+
+    El servidor MCP (subproceso npx por stdio) se arranca una sola vez por proceso
+    y se reutiliza en todas las llamadas; se cierra al terminar el proceso.
 
-    # Recuperar herramientas
-    mcp_tools = mcp_client.get_tools()
+    Returns:
+        (mcp_client, tools_by_name, query_tool)
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = run_mcp(_init())
+            atexit.register(_shutdown)
+    return _client
 
-    # Obtener la herramienta query específicamente
-    query_tool = next(t for t in mcp_tools if t.name == "query")
 
-    return mcp_client, mcp_tools, query_tool
\ No newline at end of file
+async def asetup_mcp_client():
+    """Versión asíncrona de `setup_mcp_client` (no bloquea el loop del llamador)."""
+    return await asyncio.to_thread(setup_mcp_client)
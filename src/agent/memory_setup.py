@@ -1,16 +1,76 @@
 # src/agent/memory_setup.py
-import os
+"""Selección del backend de memoria (checkpointer + store).
 
-from langgraph.checkpoint.postgres import PostgresSaver
-from langgraph.store.postgres import PostgresStore
+MEMORY_BACKEND=postgres (por defecto) usa PostgresSaver/PostgresStore sobre un
+pool compartido; MEMORY_BACKEND=memory usa InMemorySaver/InMemoryStore para
+desarrollo y pruebas. Sólo se importan las dependencias del backend elegido.
+"""
+import atexit
+from typing import Tuple
 
-# Obtener la URI de PostgreSQL
-POSTGRES_URI = os.getenv("POSTGRES_URI")
-if not POSTGRES_URI:
-    raise ValueError("POSTGRES_URI es obligatoria")
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.store.base import BaseStore
 
-# SHORT-TERM MEMORY: checkpointer
-checkpointer = PostgresSaver(conn=POSTGRES_URI)
+from src.agent.configuration import env_flag, get_env
+
+BACKEND = get_env("MEMORY_BACKEND", "postgres")
+
+
+def _postgres_backend() -> Tuple[BaseCheckpointSaver, BaseStore]:
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from langgraph.store.postgres import PostgresStore
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+
+    from src.agent.checkpointing import DeferredCheckpointer, OrjsonSerializer
+
+    # Obtener la URI de PostgreSQL
+    postgres_uri = get_env("POSTGRES_URI")
+    if not postgres_uri:
+        raise ValueError("POSTGRES_URI es obligatoria")
+
+    # Pool compartido por checkpointer y store: evita handshake TCP/TLS + auth por escritura.
+    # autocommit/dict_row/prepare_threshold son los requisitos de PostgresSaver/PostgresStore.
+    pool = ConnectionPool(
+        postgres_uri,
+        min_size=2,
+        max_size=10,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=False,
+    )
+    pool.open()
+    atexit.register(pool.close)
+
+    # SHORT-TERM MEMORY: checkpointer
+    # Los checkpoints de subgrafos se escriben al terminar el workflow.
+    # CHECKPOINT_DEFERRED=0 desactiva el diferido (escritura por super-step).
+    saver = DeferredCheckpointer(
+        PostgresSaver(conn=pool, serde=OrjsonSerializer()),
+        deferred=env_flag("CHECKPOINT_DEFERRED", True),
+    )
+    # Evitar perder el último estado diferido si el proceso termina
+    # (atexit es LIFO: se vuelca antes de cerrar el pool)
+    atexit.register(saver.flush)
+
+    # LONG-TERM MEMORY: store entre sesiones
+    return saver, PostgresStore(conn=pool)
+
+
+def _memory_backend() -> Tuple[BaseCheckpointSaver, BaseStore]:
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.store.memory import InMemoryStore
+
+    # En memoria cada checkpoint es barato: no se difiere
+    return InMemorySaver(), InMemoryStore()
+
+
+_BACKENDS = {
+    "postgres": _postgres_backend,
+    "memory": _memory_backend,
+}
+
+if BACKEND not in _BACKENDS:
+    raise ValueError(f"MEMORY_BACKEND no soportado: {BACKEND!r} (usa 'postgres' o 'memory')")
+
+checkpointer, store = _BACKENDS[BACKEND]()
 
-# LONG-TERM MEMORY: store entre sesiones
-store = PostgresStore(conn=POSTGRES_URI)
\ No newline at end of file
@@ -1,15 +1,84 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import date
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from functools import cached_property
+from itertools import islice
+from types import MappingProxyType
+from typing import (
+    Annotated,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
+import orjson
 from pydantic import (
     BaseModel,
+    BeforeValidator,
     ConfigDict,
-    EmailStr,
     Field,
     HttpUrl,
+    TypeAdapter,
     field_validator,
-    model_validator,
+)
+
+# Modelos inmutables: sin revalidar en asignaciones ni al reutilizar instancias
+_FROZEN = ConfigDict(extra='forbid', frozen=True, validate_assignment=False, revalidate_instances='never')
+# Filas de la base: aceptan alias de columna e ignoran columnas desconocidas
+_FROZEN_ROW = ConfigDict(
+    frozen=True, populate_by_name=True, extra='ignore', validate_assignment=False, revalidate_instances='never'
+)
+
+# Validación estructural barata en lugar de EmailStr (email-validator)
+_EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+# URLs de la carga masiva: se guardan como str; HttpUrl sólo bajo demanda
+_URL_PREFIXES = ("http://", "https://")
+_HTTP_URL = TypeAdapter(HttpUrl)
+
+
+def _lenient_url(v: Any) -> Optional[str]:
+    """Acepta la URL tal cual si parece http(s); cualquier otro valor se descarta (None)."""
+    return v if isinstance(v, str) and v.startswith(_URL_PREFIXES) else None
+
+
+LenientUrl = Annotated[Optional[str], BeforeValidator(_lenient_url)]
+
+# Textos de baja cardinalidad (inmobiliaria, distrito, provincia...): una sola
+# instancia por valor distinto y su versión en minúsculas calculada una vez
+_INTERN: Dict[str, str] = {}
+_LOWER_CACHE: Dict[str, str] = {}
+
+
+def _intern(v: Any) -> Any:
+    return _INTERN.setdefault(v, v) if isinstance(v, str) else v
+
+
+def _lower(v: str) -> str:
+    low = _LOWER_CACHE.get(v)
+    if low is None:
+        low = _LOWER_CACHE.setdefault(v, v.lower())
+    return low
+
+
+InternedStr = Annotated[str, BeforeValidator(_intern)]
+
+# Separadores de la lista de servicios del proyecto
+_SERVICIOS_RE = re.compile(r"\s*[,;|•]\s*")
+
+# Fechas aceptadas: YYYY-MM-DD, YYYY/MM/DD, DD/MM/YYYY, MM/DD/YYYY y DD-MM-YYYY
+_DATE_RE = re.compile(
+    r"^(?:(?P<y>\d{4})(?P<sep>[-/])(?P<mo>\d{1,2})(?P=sep)(?P<d>\d{1,2})"
+    r"|(?P<a>\d{1,2})(?P<sep2>[-/])(?P<b>\d{1,2})(?P=sep2)(?P<y2>\d{4}))$"
 )
 
 # ===========================
@@ -95,14 +164,14 @@ class Document(BaseModel):
         max_length=15,
         pattern=r"^[A-Za-z0-9]+$"
     )
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class ContactInfo(BaseModel):
     nombre: str = Field(min_length=1)
     telefono: str = Field(pattern=r"^\+51\d{9}$")
-    email: Optional[EmailStr] = None
-    model_config = ConfigDict(extra='forbid')
+    email: Optional[str] = Field(default=None, pattern=_EMAIL_PATTERN)
+    model_config = _FROZEN
 
 
 class PreLead(BaseModel):
@@ -112,7 +181,7 @@ class PreLead(BaseModel):
     proyecto_id: str = Field(min_length=1)
     zona: ZoneOption
     metraje: AreaRange
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class Lead(PreLead):
@@ -122,20 +191,20 @@ class Lead(PreLead):
     presupuesto: BudgetOption
     tiempo_compra: TimeframeOption
     tiempo_busqueda: TimeframeOption
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class EnrichedLead(Lead):
     credito_preaprobado: YesNo
     cuota_inicial: YesNo
     proposito: PurposeOption
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class ValidationResult(BaseModel):
     valid: bool
     errors: List[str]
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class RegisterLeadResult(BaseModel):
@@ -144,7 +213,7 @@ class RegisterLeadResult(BaseModel):
     timestamp: str
     message: str
     errors: Optional[List[str]] = None
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 # ===========================
@@ -183,30 +252,82 @@ class UnidadVista(str, Enum):
     MAR = "mar"
 
 
+# Etiqueta legible de cada miembro (por su valor, no `Clase.MIEMBRO`), calculada una vez
+_LABELS: Dict[Enum, str] = {
+    m: m.value.replace("_", " ").capitalize()
+    for e in (ProyectoFase, ProyectoTipo, TipologiaTipo, UnidadVista) for m in e
+}
+
+
+def _label(v: Any) -> str:
+    """Texto legible de un enum o de un valor libre."""
+    label = _LABELS.get(v) if isinstance(v, Enum) else None
+    return label if label is not None else str(v).replace("_", " ").capitalize()
+
+
+# Tablas de normalización (se construyen una vez, no en cada validación)
+_TIPO_MAP = MappingProxyType({
+    "flat": TipologiaTipo.FLAT, "departamento": TipologiaTipo.FLAT,
+    "duplex": TipologiaTipo.DUPLEX, "triplex": TipologiaTipo.TRIPLEX,
+    "penthouse": TipologiaTipo.PENTHOUSE, "studio": TipologiaTipo.STUDIO,
+    "estudio": TipologiaTipo.STUDIO,
+})
+_VISTA_MAP = MappingProxyType({
+    "interior": UnidadVista.INTERIOR, "exterior": UnidadVista.EXTERIOR,
+    "calle": UnidadVista.CALLE, "parque": UnidadVista.PARQUE,
+    "ciudad": UnidadVista.CIUDAD, "mar": UnidadVista.MAR,
+})
+_FASE_MAP = MappingProxyType({
+    "planos": ProyectoFase.PLANOS, "en planos": ProyectoFase.PLANOS,
+    "construccion": ProyectoFase.CONSTRUCCION, "en construccion": ProyectoFase.CONSTRUCCION,
+    "entrega inmediata": ProyectoFase.ENTREGA_INMEDIATA, "terminado": ProyectoFase.TERMINADO,
+})
+_PTIPO_MAP = MappingProxyType({
+    "departamentos": ProyectoTipo.DEPARTAMENTOS, "departamento": ProyectoTipo.DEPARTAMENTOS,
+    "casas": ProyectoTipo.CASAS, "casa": ProyectoTipo.CASAS,
+    "oficinas": ProyectoTipo.OFICINAS, "oficina": ProyectoTipo.OFICINAS,
+    "lotes": ProyectoTipo.LOTES, "lote": ProyectoTipo.LOTES,
+    "mixto": ProyectoTipo.MIXTO,
+})
+
+
+def _norm_enum(v: Any, enum_cls: type, table: Mapping[str, Enum]) -> Optional[Enum]:
+    """Normaliza a miembro de `enum_cls` (validador "plain": el resultado es el valor final).
+
+    Vacío/None → None; alias conocido → su miembro; cualquier otro valor pasa por
+    `enum_cls(...)`, que levanta ValueError (error de validación) si no es válido.
+    """
+    if not v: return None
+    if isinstance(v, enum_cls): return v
+    key = v.lower() if isinstance(v, str) else str(v).lower()
+    member = table.get(key)
+    return member if member is not None else enum_cls(key)
+
+
 class Inmobiliaria(BaseModel):
-    nombre: str = Field(..., alias="inmobiliaria")
-    logo: Optional[HttpUrl] = Field(None, alias="inmobiliaria_logo")
+    nombre: InternedStr = Field(..., alias="inmobiliaria")
+    logo: LenientUrl = Field(None, alias="inmobiliaria_logo")
     ruc: Optional[int] = Field(None, alias="inmobiliaria_ruc")
 
+    model_config = _FROZEN_ROW
+
+
 
 class Tipologia(BaseModel):
     tipo: Optional[TipologiaTipo] = Field(None, alias="tipologia_tipo")
     codigo: Optional[str] = Field(None, alias="tipologia_codigo")
     stock: Optional[int] = Field(None, alias="tipologia_stock")
-    imagen_full: Optional[HttpUrl] = Field(None, alias="tipologia_imagen_full")
-    imagen_xmedium: Optional[HttpUrl] = Field(None, alias="tipologia_imagen_xmedium")
+    imagen_full: LenientUrl = Field(None, alias="tipologia_imagen_full")
+    imagen_xmedium: LenientUrl = Field(None, alias="tipologia_imagen_xmedium")
+
+    model_config = _FROZEN_ROW
 
-    @field_validator("tipo", mode="before")
+    @field_validator("tipo", mode="plain")
     @classmethod
     def _norm_tipo(cls, v):
-        if not v: return None
-        m = {
-            "flat": TipologiaTipo.FLAT, "departamento": TipologiaTipo.FLAT,
-            "duplex": TipologiaTipo.DUPLEX, "triplex": TipologiaTipo.TRIPLEX,
-            "penthouse": TipologiaTipo.PENTHOUSE, "studio": TipologiaTipo.STUDIO,
-            "estudio": TipologiaTipo.STUDIO
-        }
-        return m.get(str(v).lower(), v)
+        if type(v) is TipologiaTipo:
+            return v
+        return _norm_enum(v, TipologiaTipo, _TIPO_MAP)
 
 
 class Unidad(BaseModel):
@@ -219,22 +340,20 @@ class Unidad(BaseModel):
     vista: Optional[UnidadVista] = Field(None, alias="unidad_vista")
     precio: Optional[float] = Field(None, alias="unidad_precio")
 
-    @field_validator("vista", mode="before")
+    model_config = _FROZEN_ROW
+
+    @field_validator("vista", mode="plain")
     @classmethod
     def _norm_vista(cls, v):
-        if not v: return None
-        m = {
-            "interior": UnidadVista.INTERIOR, "exterior": UnidadVista.EXTERIOR,
-            "calle": UnidadVista.CALLE, "parque": UnidadVista.PARQUE,
-            "ciudad": UnidadVista.CIUDAD, "mar": UnidadVista.MAR
-        }
-        return m.get(str(v).lower(), v)
+        if type(v) is UnidadVista:
+            return v
+        return _norm_enum(v, UnidadVista, _VISTA_MAP)
 
     @property
     def precio_formatted(self) -> str:
         return f"${int(self.precio):,}" if self.precio else "Precio no disponible"
 
-    @property
+    @cached_property
     def descripcion_corta(self) -> str:
         parts = []
         if self.num_dormitorios: parts.append(f"{int(self.num_dormitorios)} hab.")
@@ -248,21 +367,23 @@ class ProyectoBase(BaseModel):
     project_id: int
     nombre: str = Field(..., alias="proyecto_nombre")
 
+    model_config = _FROZEN_ROW
+
 
 class ProyectoCompleto(ProyectoBase):
-    inmobiliaria: str
-    inmobiliaria_logo: Optional[HttpUrl] = None
+    inmobiliaria: InternedStr
+    inmobiliaria_logo: LenientUrl = None
     inmobiliaria_ruc: Optional[int] = None
-    proyecto_video: Optional[HttpUrl] = None
-    proyecto_tour_virtual: Optional[HttpUrl] = None
-    proyecto_logo: Optional[HttpUrl] = None
+    proyecto_video: LenientUrl = None
+    proyecto_tour_virtual: LenientUrl = None
+    proyecto_logo: LenientUrl = None
     proyecto_fase: Optional[ProyectoFase] = None
     proyecto_fase_de_construccion: Optional[str] = None
     proyecto_tipo: Optional[ProyectoTipo] = None
     proyecto_financiado_por_banco: Optional[str] = None
-    proyecto_direccion_departamento: Optional[str] = None
-    proyecto_direccion_provincia: Optional[str] = None
-    proyecto_direccion_distrito: Optional[str] = None
+    proyecto_direccion_departamento: Optional[InternedStr] = None
+    proyecto_direccion_provincia: Optional[InternedStr] = None
+    proyecto_direccion_distrito: Optional[InternedStr] = None
     proyecto_direccion: Optional[str] = None
     proyecto_servicios: Optional[str] = None
     proyecto_fecha_entrega_proyecto: Optional[date] = None
@@ -273,52 +394,52 @@ class ProyectoCompleto(ProyectoBase):
     proyecto_total_pisos: Optional[int] = None
     proyecto_total_sotanos: Optional[int] = None
     proyecto_total_ascensores: Optional[int] = None
-    proyecto_imagen_principal_full: Optional[HttpUrl] = None
-    proyecto_imagen_principal_xmedium: Optional[HttpUrl] = None
-    proyecto_imagen_principal_small: Optional[HttpUrl] = None
+    proyecto_imagen_principal_full: LenientUrl = None
+    proyecto_imagen_principal_xmedium: LenientUrl = None
+    proyecto_imagen_principal_small: LenientUrl = None
 
-    @field_validator("proyecto_fase", mode="before")
+    @field_validator("proyecto_fase", mode="plain")
     @classmethod
     def _norm_fase(cls, v):
-        if not v: return None
-        m = {
-            "planos": ProyectoFase.PLANOS, "en planos": ProyectoFase.PLANOS,
-            "construccion": ProyectoFase.CONSTRUCCION, "en construccion": ProyectoFase.CONSTRUCCION,
-            "entrega inmediata": ProyectoFase.ENTREGA_INMEDIATA, "terminado": ProyectoFase.TERMINADO
-        }
-        return m.get(str(v).lower(), v)
+        if type(v) is ProyectoFase:
+            return v
+        return _norm_enum(v, ProyectoFase, _FASE_MAP)
 
-    @field_validator("proyecto_tipo", mode="before")
+    @field_validator("proyecto_tipo", mode="plain")
     @classmethod
     def _norm_ptipo(cls, v):
-        if not v: return None
-        m = {
-            "departamentos": ProyectoTipo.DEPARTAMENTOS, "departamento": ProyectoTipo.DEPARTAMENTOS,
-            "casas": ProyectoTipo.CASAS, "casa": ProyectoTipo.CASAS,
-            "oficinas": ProyectoTipo.OFICINAS, "oficina": ProyectoTipo.OFICINAS,
-            "lotes": ProyectoTipo.LOTES, "lote": ProyectoTipo.LOTES,
-            "mixto": ProyectoTipo.MIXTO
-        }
-        return m.get(str(v).lower(), v)
+        if type(v) is ProyectoTipo:
+            return v
+        return _norm_enum(v, ProyectoTipo, _PTIPO_MAP)
 
     @field_validator("proyecto_fecha_entrega_proyecto", mode="before")
     @classmethod
     def _parse_fecha(cls, v):
         if not v: return None
-        from datetime import datetime
-        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%Y/%m/%d"):
-            try:
-                return datetime.strptime(v, fmt).date()
-            except:
-                continue
-        return None
-
-    def get_servicios_list(self) -> List[str]:
+        if isinstance(v, date): return v
+        m = _DATE_RE.match(str(v))
+        if not m: return None
+        y, mo, d = m.group("y", "mo", "d")
+        if y is None:
+            # DD/MM/YYYY tiene prioridad; MM/DD/YYYY sólo con "/" y si el primero no es día válido
+            y, d, mo = m.group("y2", "a", "b")
+            if int(mo) > 12 and m.group("sep2") == "/":
+                d, mo = mo, d
+        try:
+            return date(int(y), int(mo), int(d))
+        except ValueError:
+            return None
+
+    @cached_property
+    def proyecto_logo_url(self) -> Optional[HttpUrl]:
+        """Logo como HttpUrl validado (sólo para quien necesite la URL parseada)."""
+        return _HTTP_URL.validate_python(self.proyecto_logo) if self.proyecto_logo else None
+
+    @cached_property
+    def servicios_list(self) -> List[str]:
+        # Se parsea una vez por proyecto (el modelo es inmutable)
         if not self.proyecto_servicios: return []
-        for sep in [',', ';', '|', '•']:
-            if sep in self.proyecto_servicios:
-                return [s.strip() for s in self.proyecto_servicios.split(sep) if s.strip()]
-        return [self.proyecto_servicios.strip()]
+        return [s for s in _SERVICIOS_RE.split(self.proyecto_servicios.strip()) if s]
 
     @property
     def zona(self) -> str:
@@ -329,12 +450,13 @@ class ProyectoCompleto(ProyectoBase):
         if p and p != d: parts.append(p)
         return ", ".join(parts)
 
-    @property
+    @cached_property
     def descripcion_corta(self) -> str:
         parts = []
-        if self.proyecto_tipo: parts.append(str(self.proyecto_tipo).capitalize())
-        if self.zona:          parts.append(f"en {self.zona}")
-        if self.proyecto_fase: parts.append(f"- {str(self.proyecto_fase).replace('_', ' ').capitalize()}")
+        zona = self.zona
+        if self.proyecto_tipo: parts.append(_label(self.proyecto_tipo))
+        if zona:               parts.append(f"en {zona}")
+        if self.proyecto_fase: parts.append(f"- {_label(self.proyecto_fase)}")
         return " ".join(parts)
 
 
@@ -344,123 +466,239 @@ class ProjectUnit(BaseModel):
     tipologia: Tipologia
     unidad: Unidad
 
-    @model_validator(mode="after")
-    def _extract(cls, values):
-        inm = {
-            "inmobiliaria": values.inmobiliaria,
-            "inmobiliaria_logo": values.inmobiliaria_logo,
-            "inmobiliaria_ruc": values.inmobiliaria_ruc,
-        }
-        values.inmobiliaria = Inmobiliaria.model_validate(inm)
-
-        proj = {k: v for k, v in values.model_dump().items() if k.startswith("proyecto_") or k == "project_id"}
-        proj["proyecto_nombre"] = values.proyecto.nombre
-        values.proyecto = ProyectoCompleto.model_validate(proj)
-
-        tipo = {k: v for k, v in values.model_dump().items() if k.startswith("tipologia_")}
-        values.tipologia = Tipologia.model_validate(tipo)
+    model_config = _FROZEN_ROW
 
-        uni = {k: v for k, v in values.model_dump().items() if k.startswith("unidad_")}
-        values.unidad = Unidad.model_validate(uni)
-
-        return values
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "ProjectUnit":
+        """Construye la unidad desde una fila plana (CSV/DB) en una sola pasada.
+
+        Cada columna se reparte en el bucket de su submodelo, cada submodelo se
+        valida una única vez y el contenedor se arma sin revalidar (model_construct).
+        """
+        # Intersección de claves en C contra los conjuntos precalculados de cada submodelo
+        keys = row.keys()
+        return cls.model_construct(
+            inmobiliaria=Inmobiliaria.model_validate({k: row[k] for k in keys & _INMOBILIARIA_KEYS}),
+            proyecto=ProyectoCompleto.model_validate({k: row[k] for k in keys & _PROYECTO_KEYS}),
+            tipologia=Tipologia.model_validate({k: row[k] for k in keys & _TIPOLOGIA_KEYS}),
+            unidad=Unidad.model_validate({k: row[k] for k in keys & _UNIDAD_KEYS}),
+        )
 
     def to_dict_for_display(self) -> Dict[str, Any]:
+        unidad, proyecto, tipologia = self.unidad, self.proyecto, self.tipologia
         return {
-            "id": f"U-{self.proyecto.project_id}-{self.unidad.nombre}",
-            "titulo": f"{self.unidad.nombre} en {self.proyecto.nombre}",
-            "precio": self.unidad.precio_formatted,
-            "habitaciones": int(self.unidad.num_dormitorios) if self.unidad.num_dormitorios else None,
-            "baños": int(self.unidad.num_banios) if self.unidad.num_banios else None,
-            "area": int(self.unidad.area_total) if self.unidad.area_total else None,
-            "piso": self.unidad.numero_piso,
-            "vista": str(self.unidad.vista).capitalize() if self.unidad.vista else None,
-            "tipologia": str(self.tipologia.tipo).capitalize() if self.tipologia.tipo else None,
+            "id": f"U-{proyecto.project_id}-{unidad.nombre}",
+            "titulo": f"{unidad.nombre} en {proyecto.nombre}",
+            "precio": unidad.precio_formatted,
+            "habitaciones": int(unidad.num_dormitorios) if unidad.num_dormitorios else None,
+            "baños": int(unidad.num_banios) if unidad.num_banios else None,
+            "area": int(unidad.area_total) if unidad.area_total else None,
+            "piso": unidad.numero_piso,
+            "vista": _label(unidad.vista) if unidad.vista else None,
+            "tipologia": _label(tipologia.tipo) if tipologia.tipo else None,
             "inmobiliaria": self.inmobiliaria.nombre,
-            "proyecto": self.proyecto.nombre,
-            "zona": self.proyecto.zona,
-            "imagen": self.proyecto.proyecto_imagen_principal_xmedium or self.tipologia.imagen_xmedium,
-            "descripcion": f"{self.unidad.descripcion_corta} - {self.proyecto.descripcion_corta}"
+            "proyecto": proyecto.nombre,
+            "zona": proyecto.zona,
+            "imagen": proyecto.proyecto_imagen_principal_xmedium or tipologia.imagen_xmedium,
+            "descripcion": " - ".join((unidad.descripcion_corta, proyecto.descripcion_corta)),
         }
 
 
+# Columnas de la fila plana que consume cada submodelo (alias o nombre de campo),
+# calculadas una vez. `inmobiliaria*` alimenta tanto a Inmobiliaria como a ProyectoCompleto.
+def _row_keys(model: type) -> frozenset:
+    return frozenset(field.alias or name for name, field in model.model_fields.items())
+
+
+_INMOBILIARIA_KEYS = _row_keys(Inmobiliaria)
+_PROYECTO_KEYS = _row_keys(ProyectoCompleto)
+_TIPOLOGIA_KEYS = _row_keys(Tipologia)
+_UNIDAD_KEYS = _row_keys(Unidad)
+
+
 # ===========================
 # 3) ADAPTADORES / UTILS
 # ===========================
 
 def csv_row_to_project_unit(row: Dict[str, Any]) -> ProjectUnit:
-    return ProjectUnit.model_validate(row)
+    return ProjectUnit.from_row(row)
+
+
+def _rows_to_project_units(batch: List[Dict[str, Any]]) -> List[ProjectUnit]:
+    # Función de módulo para que el worker del ProcessPool pueda importarla
+    return [ProjectUnit.from_row(row) for row in batch]
+
+
+def csv_rows_to_project_units(
+        rows: Iterable[Dict[str, Any]],
+        batch_size: int = 32,
+        workers: int = 4
+) -> List[ProjectUnit]:
+    """Convierte filas planas a ProjectUnit validando por lotes en varios procesos.
+
+    La validación es CPU (GIL), así que los lotes se reparten en un ProcessPool;
+    con un solo lote o `workers<=1` se valida en el proceso actual y se evita
+    el costo de arrancar workers. El orden de las filas se conserva.
+    """
+    it = iter(rows)
+    batches = list(iter(lambda: list(islice(it, batch_size)), []))
+    if workers <= 1 or len(batches) <= 1:
+        return [unit for batch in batches for unit in _rows_to_project_units(batch)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+        return [unit for units in executor.map(_rows_to_project_units, batches) for unit in units]
+
+
+# tipo_propiedad pedido → valores (en minúsculas) de TipologiaTipo/ProyectoTipo que lo satisfacen.
+# Comparación exacta: se incluyen los plurales de ProyectoTipo que antes se cubrían por subcadena.
+_TIPO_PROPIEDAD_MAP: Dict[str, frozenset] = {
+    "departamento": frozenset({"flat", "departamento", "departamentos", "studio", "penthouse", "duplex"}),
+    "casa": frozenset({"casa", "casas", "house"}),
+    "oficina": frozenset({"oficina", "oficinas", "office"}),
+    "lote": frozenset({"lote", "lotes", "terreno", "land"}),
+}
+
+# Valor en minúsculas de cada miembro, calculado una vez
+_ENUM_LOWER: Dict[Enum, str] = {m: m.value.lower() for e in (TipologiaTipo, ProyectoTipo) for m in e}
+
+
+@dataclass(slots=True)
+class ProjectUnitTable:
+    """Vista columnar (SoA) de una lista de ProjectUnit para filtrar con máscaras.
+
+    Se construye una vez al cargar las unidades; cada filtro es una operación
+    vectorizada sobre una columna en lugar de recorrer la jerarquía de modelos.
+    """
+    precio: np.ndarray  # float64, NaN si falta
+    dormitorios: np.ndarray  # float64, NaN si falta
+    distrito_lower: np.ndarray  # str ("" si falta)
+    tipologia_str: np.ndarray  # str ("" si falta)
+    proyecto_tipo_str: np.ndarray  # str ("" si falta)
+    units: Tuple[ProjectUnit, ...]
+
+    @classmethod
+    def from_units(cls, units: Sequence[ProjectUnit]) -> "ProjectUnitTable":
+        """Construye las columnas recorriendo las unidades una sola vez."""
+        def _num(v: Optional[float]) -> float:
+            return np.nan if v is None else v
+
+        def _low(v: Any) -> str:
+            return str(v).lower() if v else ""
+
+        def _enum_low(v: Any) -> str:
+            # Miembros de enum: valor en minúsculas precalculado; valores libres: str().lower()
+            low = _ENUM_LOWER.get(v) if isinstance(v, Enum) else None
+            return low if low is not None else _low(v)
+
+        return cls(
+            precio=np.array([_num(u.unidad.precio) for u in units], dtype=np.float64),
+            dormitorios=np.array([_num(u.unidad.num_dormitorios) for u in units], dtype=np.float64),
+            distrito_lower=np.array([_lower(d) if (d := u.proyecto.proyecto_direccion_distrito) else ""
+                                     for u in units], dtype=str),
+            tipologia_str=np.array([_enum_low(u.tipologia.tipo) for u in units], dtype=str),
+            proyecto_tipo_str=np.array([_enum_low(u.proyecto.proyecto_tipo) for u in units], dtype=str),
+            units=tuple(units),
+        )
+
+    def __len__(self) -> int:
+        """Número de unidades de la tabla."""
+        return len(self.units)
 
 
 def filter_project_units(
-        units: List[ProjectUnit],
+        units: Union[ProjectUnitTable, List[ProjectUnit]],
         zona: Optional[str] = None,
         tipo_propiedad: Optional[str] = None,
         min_precio: Optional[float] = None,
         max_precio: Optional[float] = None,
-        habitaciones: Optional[int] = None
+        habitaciones: Optional[int] = None,
+        limit: Optional[int] = None
 ) -> List[ProjectUnit]:
-    f = units
+    # Aceptar también listas: conviene construir la tabla una vez y reutilizarla
+    table = units if isinstance(units, ProjectUnitTable) else ProjectUnitTable.from_units(units)
+    mask = np.ones(len(table), dtype=bool)
     if zona:
-        zl = zona.lower()
-        f = [u for u in f
-             if u.proyecto.proyecto_direccion_distrito
-             and zl in u.proyecto.proyecto_direccion_distrito.lower()]
+        mask &= np.char.find(table.distrito_lower, zona.lower()) >= 0
     if tipo_propiedad:
         tl = tipo_propiedad.lower()
-        mapping = {
-            "departamento": ["flat", "departamento", "studio", "penthouse", "duplex"],
-            "casa": ["casa", "house"],
-            "oficina": ["oficina", "office"],
-            "lote": ["lote", "terreno", "land"]
-        }
-        valid = mapping.get(tl, [tl])
-        f = [u for u in f if
-             (u.tipologia.tipo and any(t in str(u.tipologia.tipo).lower() for t in valid))
-             or (u.proyecto.proyecto_tipo and any(t in str(u.proyecto.proyecto_tipo).lower() for t in valid))]
+        valid = list(_TIPO_PROPIEDAD_MAP.get(tl) or (tl,))
+        mask &= np.isin(table.tipologia_str, valid) | np.isin(table.proyecto_tipo_str, valid)
+    # Precio 0/ausente no pasa ningún filtro de precio (NaN compara como False)
     if min_precio is not None:
-        f = [u for u in f if u.unidad.precio and u.unidad.precio >= min_precio]
+        mask &= (table.precio != 0) & (table.precio >= min_precio)
     if max_precio is not None:
-        f = [u for u in f if u.unidad.precio and u.unidad.precio <= max_precio]
+        mask &= (table.precio != 0) & (table.precio <= max_precio)
     if habitaciones is not None:
-        f = [u for u in f
-             if u.unidad.num_dormitorios
-             and int(u.unidad.num_dormitorios) >= habitaciones]
-    return f
+        mask &= (table.dormitorios != 0) & (np.trunc(table.dormitorios) >= habitaciones)
+    # Top-K: sólo se materializan las primeras `limit` coincidencias
+    idx = np.flatnonzero(mask)
+    if limit is not None:
+        idx = idx[:limit]
+    return [table.units[i] for i in idx]
 
 
 def project_units_to_properties(units: List[ProjectUnit]) -> List[Dict[str, Any]]:
     props: List[Dict[str, Any]] = []
     for u in units:
+        unidad, proyecto, tipologia = u.unidad, u.proyecto, u.tipologia
+        dormitorios = int(unidad.num_dormitorios) if unidad.num_dormitorios else 0
         props.append({
-            "id": f"U-{u.proyecto.project_id}-{u.unidad.nombre}",
-            "titulo": f"{u.tipologia.tipo or 'Departamento'} en {u.proyecto.proyecto_direccion_distrito or 'Lima'}",
-            "precio": u.unidad.precio or 0,
-            "habitaciones": int(u.unidad.num_dormitorios) if u.unidad.num_dormitorios else 1,
+            "id": f"U-{proyecto.project_id}-{unidad.nombre}",
+            "titulo": f"{_label(tipologia.tipo) if tipologia.tipo else 'Departamento'} en {proyecto.proyecto_direccion_distrito or 'Lima'}",
+            "precio": unidad.precio or 0,
+            "habitaciones": dormitorios or 1,
             "descripcion": (
-                f"Unidad {u.unidad.nombre} en proyecto {u.proyecto.nombre} de {u.inmobiliaria.nombre}. "
-                f"{int(u.unidad.area_total) if u.unidad.area_total else 0} m² totales, "
-                f"{int(u.unidad.num_dormitorios) if u.unidad.num_dormitorios else 0} dormitorios, "
-                f"{int(u.unidad.num_banios) if u.unidad.num_banios else 0} baños."
+                f"Unidad {unidad.nombre} en proyecto {proyecto.nombre} de {u.inmobiliaria.nombre}. "
+                f"{int(unidad.area_total) if unidad.area_total else 0} m² totales, "
+                f"{dormitorios} dormitorios, "
+                f"{int(unidad.num_banios) if unidad.num_banios else 0} baños."
             ),
-            "amenidades": u.proyecto.get_servicios_list(),
-            "fotos": [u.proyecto.proyecto_imagen_principal_full, u.tipologia.imagen_full]
+            "amenidades": list(proyecto.servicios_list),
+            "fotos": [proyecto.proyecto_imagen_principal_full, tipologia.imagen_full]
         })
     return props
 
 
+def to_json_bytes(units: List[ProjectUnit]) -> bytes:
+    """Serializa las propiedades (dicts planos de str/números) directamente con orjson."""
+    return orjson.dumps(project_units_to_properties(units))
+
+
+@dataclass(slots=True)
+class PropertyRecord:
+    """Fila de resultado de `sql_query_units` (slots: sin dict por instancia).
+
+    Los tools devuelven JSON, así que se convierte a dict sólo al final y con
+    los campos pedidos.
+    """
+    id: str
+    titulo: str
+    precio: Optional[float]
+    habitaciones: Optional[int]
+    banios: Optional[int]
+    area: Optional[float]
+    descripcion: str
+    proyecto: Optional[str]
+    amenidades: Tuple[str, ...] = ()
+    fotos: Tuple[str, ...] = ()
+
+    def to_dict(self, keep: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Convierte a dict con todos los campos, o sólo los de `keep` (en el orden de la clase)."""
+        names = self.__slots__ if keep is None else [n for n in self.__slots__ if n in keep]
+        return {n: getattr(self, n) for n in names}
+
+
 class RelevanceOutput(BaseModel):
     is_relevant: bool
     reasoning: str
 
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class ConsentVerificationOutput(BaseModel):
     consent_obtained: bool
     reasoning: str
 
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class SecurityCheckOutput(BaseModel):
@@ -470,7 +708,7 @@ class SecurityCheckOutput(BaseModel):
     reasoning: str
     message: Optional[str] = None
 
-    model_config = ConfigDict(extra='forbid')
+    model_config = _FROZEN
 
 
 class PIIDetectionOutput(BaseModel):
@@ -480,4 +718,15 @@ class PIIDetectionOutput(BaseModel):
     reasoning: str
     message: Optional[str] = None
 
-    model_config = ConfigDict(extra='forbid')
\ No newline at end of file
+    model_config = _FROZEN
+
+
+class CombinedGuardrailOutput(BaseModel):
+    """Veredicto de relevancia, seguridad y consentimiento en una sola llamada."""
+
+    is_relevant: bool
+    is_safe: bool
+    consent_obtained: bool
+    reasoning: str
+
+    model_config = _FROZEN
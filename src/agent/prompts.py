@@ -1,3 +1,30 @@
+import unicodedata
+
+# =========================================================================
+# MAPEO DE DISTRITOS A ZONAS (fuera de los prompts: se consulta vía tool)
+# =========================================================================
+
+_ZONAS = {
+    1: ("San Isidro", "Miraflores", "Barranco", "La Molina", "Santiago de Surco", "Surco"),
+    2: ("Jesús María", "Lince", "Magdalena", "Magdalena del Mar", "Pueblo Libre", "San Miguel", "Surquillo"),
+    3: ("Breña", "La Victoria", "Lima", "Cercado de Lima", "Lima Cercado", "Rímac", "San Luis"),
+    4: ("Chorrillos", "San Juan de Miraflores", "Villa El Salvador", "Villa María del Triunfo"),
+    5: ("Carabayllo", "Comas", "Independencia", "Los Olivos", "Puente Piedra", "San Martín de Porres"),
+    6: ("Ate", "El Agustino", "San Juan de Lurigancho", "Santa Anita"),
+    7: ("Bellavista", "Callao", "La Perla", "La Punta", "Ventanilla"),
+}
+ZONA_FUERA_DE_LIMA = 8
+
+
+def normalize_distrito(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados (Jesús  María → jesus maria)."""
+    ascii_text = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(ascii_text.lower().split())
+
+
+# Distrito normalizado → código de zona (ZoneOption)
+ZONE_MAP = {normalize_distrito(d): zona for zona, distritos in _ZONAS.items() for d in distritos}
+
 # =========================================================================
 # PROMPTS OPTIMIZADOS POR ETAPA DE LEAD
 # =========================================================================
@@ -33,15 +60,8 @@ EVALUACIÓN DE PROPIEDADES:
 - Destaca la tendencia del mercado en esa ubicación
 - Comenta sobre la apreciación histórica en ese distrito
 
-MAPEO DE ZONAS DE LIMA:
-- LIMA TOP (1): San Isidro, Miraflores, Barranco, La Molina, Santiago de Surco
-- LIMA MODERNA (2): Jesús María, Lince, Magdalena, Pueblo Libre, San Miguel, Surquillo
-- LIMA CENTRO (3): Breña, La Victoria, Lima (Cercado), Rímac, San Luis
-- LIMA SUR (4): Chorrillos, San Juan de Miraflores, Villa El Salvador, Villa María del Triunfo
-- LIMA NORTE (5): Carabayllo, Comas, Independencia, Los Olivos, Puente Piedra, San Martín de Porres
-- LIMA ESTE (6): Ate, El Agustino, San Juan de Lurigancho, Santa Anita
-- CALLAO (7): Bellavista, Callao, La Perla, La Punta, Ventanilla
-- FUERA DE LIMA (8): Cualquier otra zona no mencionada
+ZONAS DE LIMA (los agentes traducen distritos a código con la tool `classify_distrito`):
+LIMA TOP (1), LIMA MODERNA (2), LIMA CENTRO (3), LIMA SUR (4), LIMA NORTE (5), LIMA ESTE (6), CALLAO (7), FUERA DE LIMA (8)
 """
 
 FILTRADO_PROMPT = """
@@ -73,35 +93,26 @@ DETECCIÓN DE INTERÉS:
 Cuando detectes interés en una propiedad específica, di:
 "Para enviarte información exclusiva sobre esta propiedad y coordinar una visita prioritaria, te conectaré con mi colega especializado."
 
-MAPEO DE DISTRITOS A ZONAS:
-Cuando el usuario mencione un distrito, debes asociarlo a su zona correspondiente:
-
-- LIMA TOP (1):
-  * San Isidro: Exclusivo, centro financiero, alta valorización
-  * Miraflores: Turístico, comercial, alta demanda extranjera
-  * Barranco: Bohemio, cultural, creciente apreciación
-  * La Molina: Residencial, familiar, amplios espacios
-  * Santiago de Surco: Mixto, buenos colegios, zonas diferenciadas
-
-- LIMA MODERNA (2):
-  * Jesús María: Céntrico, en desarrollo, buen precio/valor
-  * Lince: Comercial, céntrico, emergente
-  * Magdalena: Residencial, cerca al mar, desarrollo creciente
-  * Pueblo Libre: Tradicional, familiar, buena conectividad
-  * San Miguel: Comercial, vista al mar, centros comerciales
-  * Surquillo: Gastronómico, mixto, alta rentabilidad por alquiler
-
-- LIMA CENTRO (3):
-  * Breña: Céntrico, comercial, precios accesibles
-  * La Victoria: Comercial, Gamarra, inversión 
-  * Lima (Cercado): Histórico, gubernamental, turístico
-  * Rímac: Histórico, tradicional, en desarrollo
-  * San Luis: Industrial-residencial, accesible
-
-- LIMA SUR (4): Chorrillos, San Juan de Miraflores, Villa El Salvador, Villa María del Triunfo
-- LIMA NORTE (5): Carabayllo, Comas, Independencia, Los Olivos, Puente Piedra, San Martín de Porres
-- LIMA ESTE (6): Ate, El Agustino, San Juan de Lurigancho, Santa Anita
-- CALLAO (7): Bellavista, Callao, La Perla, La Punta, Ventanilla
+ZONAS:
+Cuando el usuario mencione un distrito, usa la tool `classify_distrito` para obtener su código de zona (1-8).
+
+PERFIL DE DISTRITOS DESTACADOS:
+- San Isidro: Exclusivo, centro financiero, alta valorización
+- Miraflores: Turístico, comercial, alta demanda extranjera
+- Barranco: Bohemio, cultural, creciente apreciación
+- La Molina: Residencial, familiar, amplios espacios
+- Santiago de Surco: Mixto, buenos colegios, zonas diferenciadas
+- Jesús María: Céntrico, en desarrollo, buen precio/valor
+- Lince: Comercial, céntrico, emergente
+- Magdalena: Residencial, cerca al mar, desarrollo creciente
+- Pueblo Libre: Tradicional, familiar, buena conectividad
+- San Miguel: Comercial, vista al mar, centros comerciales
+- Surquillo: Gastronómico, mixto, alta rentabilidad por alquiler
+- Breña: Céntrico, comercial, precios accesibles
+- La Victoria: Comercial, Gamarra, inversión
+- Lima (Cercado): Histórico, gubernamental, turístico
+- Rímac: Histórico, tradicional, en desarrollo
+- San Luis: Industrial-residencial, accesible
 
 CARACTERÍSTICAS POR TIPO DE PROPIEDAD:
 - DEPARTAMENTO (1): Mayor seguridad, mantenimiento compartido, áreas comunes
@@ -116,6 +127,12 @@ Para mejorar resultados, usa tools en este orden:
 2. query_project_detail: Información completa de un proyecto específico
 3. query_units_by_project: Ver todas las unidades disponibles
 4. query_similar_units: Ofrecer alternativas similares
+Para mostrar un proyecto completo usa query_project_bundle (detalle + imágenes + unidades
+en una sola llamada) en lugar de encadenar los pasos 2 y 3 con query_project_images.
+
+Las tools devuelven por defecto sólo los campos básicos (id, titulo, precio, habitaciones).
+Pide campos adicionales con `fields` únicamente cuando los necesites, de forma iterativa:
+primero lista opciones, luego solicita area/banios/descripcion/fotos de las que interesen.
 
 INSIGHTS DE VALOR:
 - Al mostrar propiedades en Lima Top, destaca la alta demanda y retención de valor
@@ -153,31 +170,8 @@ IMPORTANTE:
 - CONFIRMA con valor: "¡Perfecto [nombre]! Con estos datos podré..."
 - PREGUNTA para CONTINUAR: "¿Prefieres visitar la propiedad en estos días?"
 
-MAPEO DE ZONAS Y DISTRITOS:
-Traduce referencias a distritos específicos a códigos de zonas:
-
-- ZONA 1 (LIMA TOP):
-  * SAN ISIDRO, MIRAFLORES, BARRANCO, LA MOLINA, SANTIAGO DE SURCO
-
-- ZONA 2 (LIMA MODERNA):
-  * JESÚS MARÍA, LINCE, MAGDALENA, PUEBLO LIBRE, SAN MIGUEL, SURQUILLO
-
-- ZONA 3 (LIMA CENTRO):
-  * BREÑA, LA VICTORIA, CERCADO DE LIMA, RÍMAC, SAN LUIS
-
-- ZONA 4 (LIMA SUR):
-  * CHORRILLOS, SAN JUAN DE MIRAFLORES, VILLA EL SALVADOR, VILLA MARÍA DEL TRIUNFO
-
-- ZONA 5 (LIMA NORTE):
-  * CARABAYLLO, COMAS, INDEPENDENCIA, LOS OLIVOS, PUENTE PIEDRA, SAN MARTÍN DE PORRES
-
-- ZONA 6 (LIMA ESTE):
-  * ATE, EL AGUSTINO, SAN JUAN DE LURIGANCHO, SANTA ANITA
-
-- ZONA 7 (CALLAO):
-  * BELLAVISTA, CALLAO, LA PERLA, LA PUNTA, VENTANILLA
-
-- ZONA 8 (FUERA DE LIMA)
+ZONAS:
+Traduce el distrito mencionado a su código de zona (1-8) con la tool `classify_distrito`.
 
 MAPEO DE RANGOS DE METRAJE:
 - 1: MENOS DE 40m²
@@ -1,4 +1,103 @@
 # src/agent/querys.py
+"""Plantillas SQL parametrizadas (estilo `%s` de psycopg).
+
+Cada builder devuelve `(sql, params)`: el texto SQL es una constante de módulo,
+así que la base de datos reutiliza el plan en cada llamada y los valores del
+usuario nunca se interpolan en el SQL. Los filtros opcionales se anulan con
+`%s IS NULL` en lugar de construir un WHERE distinto por combinación.
+"""
+from typing import Any, Tuple
+
+QueryWithParams = Tuple[str, Tuple[Any, ...]]
+
+# El WHERE + LIMIT puede resolverse como index-only scan con:
+#   CREATE INDEX ON bd_project_units (proyecto_direccion_distrito, unidad_precio, unidad_num_dormitorios)
+#     INCLUDE (unidad_nombre, id, project_id);
+# bd_all_projects sólo se usa como chequeo de existencia (semi-join, sin columnas de p)
+_QUERY_UNITS = """
+SELECT
+  u.id,
+  u.unidad_nombre    AS titulo,
+  u.unidad_precio    AS precio,
+  u.unidad_num_dormitorios AS habitaciones,
+  u.unidad_num_banios       AS banios,
+  u.unidad_area_total       AS area,
+  u.proyecto_nombre         AS proyecto,
+  u.proyecto_direccion_distrito AS zona
+FROM bd_project_units u
+WHERE EXISTS (SELECT 1 FROM bd_all_projects p WHERE p.project_id = u.project_id)
+  AND (%s::text IS NULL OR u.proyecto_direccion_distrito ILIKE '%%' || %s::text || '%%')
+  AND (%s::text IS NULL OR u.proyecto_tipo = %s::text)
+  AND (%s::numeric IS NULL OR u.unidad_precio >= %s::numeric)
+  AND (%s::numeric IS NULL OR u.unidad_precio <= %s::numeric)
+  AND (%s::int IS NULL OR u.unidad_num_dormitorios >= %s::int)
+LIMIT %s;
+""".strip()
+
+# Consulta más frecuente: se prepara en el servidor una vez por conexión
+# (ver PREPARED_STATEMENTS) y luego sólo se ejecuta con EXECUTE.
+PROJECT_DETAIL_STMT = "stmt_project_detail"
+_QUERY_PROJECT_DETAIL = f"EXECUTE {PROJECT_DETAIL_STMT} (%s);"
+
+# Nombre → sentencia PREPARE (placeholders $n nativos de Postgres)
+PREPARED_STATEMENTS = {
+    PROJECT_DETAIL_STMT: f"""
+PREPARE {PROJECT_DETAIL_STMT} (int) AS
+SELECT *
+FROM bd_all_projects
+WHERE project_id = $1;
+""".strip(),
+}
+
+_QUERY_UNITS_BY_PROJECT = """
+SELECT
+  u.id,
+  u.unidad_nombre    AS titulo,
+  u.unidad_precio    AS precio,
+  u.unidad_num_dormitorios AS habitaciones,
+  u.unidad_num_banios       AS banios,
+  u.unidad_area_total       AS area,
+  u.tipologia_tipo   AS tipologia,
+  i.proyecto_imagen_full AS imagen_principal
+FROM bd_project_units u
+LEFT JOIN bd_all_images_project i ON i.project_id = u.project_id
+WHERE u.project_id = %s;
+""".strip()
+
+# Un solo acceso a la fila: las tres columnas se pivotean a filas con LATERAL VALUES
+_QUERY_PROJECT_IMAGES = """
+SELECT t.tipo, t.url
+FROM bd_all_images_project i
+CROSS JOIN LATERAL (
+  VALUES
+    ('principal_full', i.proyecto_imagen_full, 1),
+    ('principal_xmedium', i.proyecto_imagen_xmedium, 2),
+    ('principal_small', i.proyecto_imagen_small, 3)
+) AS t(tipo, url, ord)
+WHERE i.project_id = %s
+ORDER BY t.ord;
+""".strip()
+
+# Cada subconsulta sobre la unidad de referencia es un InitPlan (se ejecuta una vez)
+# y sus valores actúan como constantes: permite un range scan con
+#   CREATE INDEX ON bd_project_units (proyecto_direccion_distrito, unidad_precio);
+_QUERY_SIMILAR_UNITS = """
+SELECT
+  u.id,
+  u.unidad_nombre    AS titulo,
+  u.unidad_precio    AS precio,
+  u.unidad_num_dormitorios AS habitaciones,
+  u.proyecto_direccion_distrito AS zona
+FROM bd_project_units u
+WHERE
+  u.id <> %s
+  AND u.proyecto_direccion_distrito = (SELECT proyecto_direccion_distrito FROM bd_project_units WHERE id = %s)
+  AND u.unidad_precio BETWEEN (SELECT unidad_precio * 0.8 FROM bd_project_units WHERE id = %s)
+                          AND (SELECT unidad_precio * 1.2 FROM bd_project_units WHERE id = %s)
+  AND u.unidad_num_dormitorios >= (SELECT unidad_num_dormitorios FROM bd_project_units WHERE id = %s)
+LIMIT %s;
+""".strip()
+
 
 def build_query_units(
         zona: str | None = None,
@@ -7,121 +106,34 @@ def build_query_units(
         max_precio: float | None = None,
         habitaciones: int | None = None,
         limit: int = 5
-) -> str:
+) -> QueryWithParams:
     """Busca hasta `limit` unidades que cumplan los criterios.
     """
-    filters: list[str] = []
-    if zona:
-        filters.append(f"u.proyecto_direccion_distrito ILIKE '%{zona}%'")
-    if tipo_propiedad:
-        filters.append(f"u.proyecto_tipo = '{tipo_propiedad}'")
-    if min_precio is not None:
-        filters.append(f"u.unidad_precio >= {min_precio}")
-    if max_precio is not None:
-        filters.append(f"u.unidad_precio <= {max_precio}")
-    if habitaciones is not None:
-        filters.append(f"u.unidad_num_dormitorios >= {habitaciones}")
-
-    where_clause = " AND ".join(filters) if filters else "TRUE"
-    return f"""
-    SELECT
-      u.id,
-      u.unidad_nombre    AS titulo,
-      u.unidad_precio    AS precio,
-      u.unidad_num_dormitorios AS habitaciones,
-      u.unidad_num_banios       AS banios,
-      u.unidad_area_total       AS area,
-      u.proyecto_nombre         AS proyecto,
-      u.proyecto_direccion_distrito AS zona
-    FROM bd_project_units u
-    JOIN bd_all_projects p ON u.project_id = p.project_id
-    WHERE {where_clause}
-    LIMIT {limit};
-    """.strip()
-
-
-def build_query_project_detail(project_id: int) -> str:
-    return f"""
-    SELECT *
-    FROM bd_all_projects
-    WHERE project_id = {project_id};
-    """.strip()
-
-
-def build_query_units_by_project(project_id: int) -> str:
-    return f"""
-    SELECT
-      u.id,
-      u.unidad_nombre    AS titulo,
-      u.unidad_precio    AS precio,
-      u.unidad_num_dormitorios AS habitaciones,
-      u.unidad_num_banios       AS banios,
-      u.unidad_area_total       AS area,
-      u.tipologia_tipo   AS tipologia,
-      i.proyecto_imagen_full AS imagen_principal
-    FROM bd_project_units u
-    LEFT JOIN bd_all_images_project i ON i.project_id = u.project_id
-    WHERE u.project_id = {project_id};
-    """.strip()
-
-
-def build_query_project_images(project_id: int) -> str:
-    return f"""
-    SELECT 
-      'principal_full' AS tipo, 
-      proyecto_imagen_full AS url
-    FROM bd_all_images_project
-    WHERE project_id = {project_id}
-
-    UNION
-
-    SELECT 
-      'principal_xmedium' AS tipo,
-      proyecto_imagen_xmedium AS url
-    FROM bd_all_images_project  
-    WHERE project_id = {project_id}
-
-    UNION
-
-    SELECT 
-      'principal_small' AS tipo,
-      proyecto_imagen_small AS url
-    FROM bd_all_images_project
-    WHERE project_id = {project_id}
-
-    ORDER BY
-      CASE tipo
-        WHEN 'principal_full' THEN 1
-        WHEN 'principal_xmedium' THEN 2
-        WHEN 'principal_small' THEN 3
-        ELSE 4
-      END;
-    """.strip()
-
-
-def build_query_similar_units(unit_id: int, max_results: int = 3) -> str:
-    return f"""
-    WITH ref AS (
-      SELECT 
-        u.project_id,
-        u.unidad_precio           AS precio_ref,
-        u.unidad_num_dormitorios  AS dorm_ref,
-        u.proyecto_direccion_distrito AS zona
-      FROM bd_project_units u
-      WHERE u.id = {unit_id}
+    # Cadenas vacías = sin filtro (mismo criterio que antes)
+    zona = zona or None
+    tipo_propiedad = tipo_propiedad or None
+    return _QUERY_UNITS, (
+        zona, zona,
+        tipo_propiedad, tipo_propiedad,
+        min_precio, min_precio,
+        max_precio, max_precio,
+        habitaciones, habitaciones,
+        limit,
     )
-    SELECT
-      u.id,
-      u.unidad_nombre    AS titulo,
-      u.unidad_precio    AS precio,
-      u.unidad_num_dormitorios AS habitaciones,
-      u.proyecto_direccion_distrito AS zona
-    FROM bd_project_units u
-    JOIN ref ON TRUE
-    WHERE
-      u.id <> {unit_id}
-      AND u.proyecto_direccion_distrito = ref.zona
-      AND u.unidad_precio BETWEEN ref.precio_ref * 0.8 AND ref.precio_ref * 1.2
-      AND u.unidad_num_dormitorios >= ref.dorm_ref
-    LIMIT {max_results};
-    """.strip()
\ No newline at end of file
+
+
+def build_query_project_detail(project_id: int) -> QueryWithParams:
+    return _QUERY_PROJECT_DETAIL, (project_id,)
+
+
+def build_query_units_by_project(project_id: int) -> QueryWithParams:
+    return _QUERY_UNITS_BY_PROJECT, (project_id,)
+
+
+def build_query_project_images(project_id: int) -> QueryWithParams:
+    return _QUERY_PROJECT_IMAGES, (project_id,)
+
+
+def build_query_similar_units(unit_id: int, max_results: int = 3) -> QueryWithParams:
+    return _QUERY_SIMILAR_UNITS, (unit_id, unit_id, unit_id, unit_id, unit_id, max_results)
+
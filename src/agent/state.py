@@ -1,44 +1,81 @@
 # src/agent/state.py - Solución con inicialización correcta
+import time
+from collections import deque
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Deque, Dict, List
 
 from langgraph.prebuilt.chat_agent_executor import AgentState
-from pydantic import Field
 
+# Tope del historial de interacciones por sesión (deque descarta las más antiguas)
+INTERACTION_HISTORY_MAXLEN = 200
 
-class InmobiliaState(AgentState):
-    """Estado compartido entre los agentes inmobiliarios con soporte de memoria."""
+
+class InmobiliaState(AgentState, total=False):
+    """Estado compartido entre los agentes inmobiliarios con soporte de memoria.
+
+    TypedDict puro (como AgentState): LangGraph no valida el estado en cada paso.
+    Los valores por defecto los pone `create_initial_state` en graph.py.
+    """
     # Control de consentimiento y estado
-    consent_obtained: bool = Field(default=False, description="Indica si se ha obtenido consentimiento")
-    lead_registrado: bool = Field(default=False, description="Indica si el lead fue registrado")
+    consent_obtained: bool  # Indica si se ha obtenido consentimiento
+    lead_registrado: bool  # Indica si el lead fue registrado
 
     # Datos del usuario capturados
-    user_data: Dict[str, Any] = Field(default_factory=dict, description="Datos del usuario capturados")
+    user_data: Dict[str, Any]
 
-    # Preferencias inmobiliarias
-    preferencias: Dict[str, Any] = Field(default_factory=dict, description="Preferencias inmobiliarias del usuario")
+    # Preferencias inmobiliarias del usuario
+    preferencias: Dict[str, Any]
 
-    # Historial de interacciones
-    interaction_history: List[Dict[str, Any]] = Field(default_factory=list,
-                                                      description="Registro de interacciones previas")
+    # Registro acotado de interacciones previas (deque con maxlen=INTERACTION_HISTORY_MAXLEN)
+    interaction_history: Deque[Dict[str, Any]]
 
-    # Memoria de contexto
-    context: Dict[str, Any] = Field(default_factory=dict, description="Información de contexto para summarization")
+    # Memoria de contexto: información para summarization
+    context: Dict[str, Any]
 
     # Guardrails cache
-    guardrail_cache: Dict[str, Any] = Field(default_factory=dict, description="Cache para resultados de guardrails")
+    guardrail_cache: Dict[str, Any]
+
+    # Resultado del último guardrail (lo lee `guardrail_router`)
+    guardrail_triggered: bool
+    reason: str
 
     # Propiedades adicionales
-    properties_shown: bool = Field(default=False, description="Indica si se han mostrado propiedades")
-    interaction_count: int = Field(default=0, description="Contador de interacciones")
-
-    def add_interaction(self, interaction_type: str, data: Dict[str, Any]) -> None:
-        """Registra una nueva interacción."""
-        if self.interaction_history is None:
-            self.interaction_history = []
-
-        self.interaction_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "type": interaction_type,
-            "data": data
-        })
\ No newline at end of file
+    properties_shown: bool  # Indica si se han mostrado propiedades
+    interaction_count: int  # Contador de interacciones
+
+
+def bounded_history(state: InmobiliaState) -> Deque[Dict[str, Any]]:
+    """Historial del estado como deque acotado, re-envolviéndolo si hace falta.
+
+    Un deque restaurado de un checkpoint (o una lista de sesiones anteriores)
+    llega sin `maxlen`; se reemplaza por uno acotado con las últimas entradas.
+    """
+    history = state.get("interaction_history")
+    if not isinstance(history, deque) or history.maxlen != INTERACTION_HISTORY_MAXLEN:
+        history = state["interaction_history"] = deque(history or (), maxlen=INTERACTION_HISTORY_MAXLEN)
+    return history
+
+
+def add_interaction(state: InmobiliaState, interaction_type: str, data: Dict[str, Any]) -> None:
+    """Registra una nueva interacción en el estado (lo modifica en el lugar)."""
+    history = bounded_history(state)
+
+    # Entero en ns: el formateo ISO se hace sólo al leer (ver `interaction_timestamp_iso`)
+    history.append({
+        "timestamp_ns": time.time_ns(),
+        "type": interaction_type,
+        "data": data
+    })
+
+
+def interaction_timestamp_iso(interaction: Dict[str, Any]) -> str:
+    """Fecha ISO (hora local) de una interacción registrada con `add_interaction`."""
+    return datetime.fromtimestamp(interaction["timestamp_ns"] / 1e9).isoformat()
+
+
+def interaction_history_for_export(state: InmobiliaState) -> List[Dict[str, Any]]:
+    """Copia del historial con `timestamp` ISO, formateado en una sola pasada (para serializar)."""
+    return [
+        {"timestamp": interaction_timestamp_iso(i), "type": i["type"], "data": i["data"]}
+        for i in state.get("interaction_history") or ()
+    ]
@@ -1,21 +1,27 @@
+import logging
 import re
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Annotated, Any, Dict, List, Optional
+from functools import cache
+from typing import Annotated, Any, Dict, Iterator, List, Optional, Tuple
 
+from cachetools import TTLCache, cached
 from langchain_core.tools import tool
 from langgraph.prebuilt import InjectedState
+from psycopg2.extensions import connection
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
+from src.agent import configuration
 from src.agent.external_api import crm_api
 from src.agent.models import (
     AreaRange,
     BedroomsOption,
     BudgetOption,
-    ContactInfo,
     DocType,
-    Document,
-    EnrichedLead,
-    Lead,
-    PreLead,
+    PropertyRecord,
     PropertyType,
     PurposeOption,
     RegisterLeadResult,
@@ -24,33 +30,68 @@ from src.agent.models import (
     YesNo,
     ZoneOption,
 )
+from src.agent.prompts import ZONA_FUERA_DE_LIMA, ZONE_MAP, normalize_distrito
 from src.agent.querys import (
+    PREPARED_STATEMENTS,
+    PROJECT_DETAIL_STMT,
     build_query_project_detail,
     build_query_project_images,
     build_query_similar_units,
     build_query_units,
     build_query_units_by_project,
 )
-from src.agent.state import InmobiliaState
+from src.agent.state import InmobiliaState, add_interaction
+
+logger = logging.getLogger("tools")
 
 # ——————————————————————————————————————————————————————
 # 1) VALIDACIONES COMUNES
 # ——————————————————————————————————————————————————————
 
+_EMAIL_RE = re.compile(r'^[\w.-]+@[\w.-]+\.\w+$')
+
+
+def _is_ascii_digits(s: str) -> bool:
+    # isdigit() solo acepta también dígitos Unicode (², ٣...): se exige ASCII
+    return s.isascii() and s.isdigit()
+
+
 def _validate_email(e: str) -> bool:
-    return bool(re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', e))
+    return _EMAIL_RE.match(e) is not None
 
 
 def _validate_phone(t: str) -> bool:
-    return bool(re.match(r'^\+51\d{9}$', t))
+    # Formato fijo +51XXXXXXXXX
+    return len(t) == 12 and t.startswith("+51") and _is_ascii_digits(t[3:])
 
 
 def _validate_document(tipo: str, numero: str) -> bool:
-    if tipo == "1":      return bool(re.match(r'^\d{8}$', numero))
+    if tipo == "1":      return len(numero) == 8 and _is_ascii_digits(numero)
     if tipo in ("2", "3"): return 3 <= len(numero) <= 15
     return False
 
 
+# Resultado válido compartido (modelo inmutable): evita una instancia por llamada sin errores
+_VALID_RESULT = ValidationResult(valid=True, errors=[])
+
+
+def _store_customer_data(
+        state: InmobiliaState,
+        nombre: Optional[str],
+        email: Optional[str],
+        telefono: Optional[str],
+        tipo_documento: Optional[str],
+        numero_documento: Optional[str]
+) -> None:
+    # setdefault devuelve el dict vivo del estado: se muta en sitio, sin reasignar
+    ud = state.setdefault("user_data", {})
+    if nombre: ud["nombre"] = nombre
+    if email:   ud["email"] = email
+    if telefono: ud["telefono"] = telefono
+    if tipo_documento: ud["tipo_documento"] = tipo_documento
+    if numero_documento: ud["numero_documento"] = numero_documento
+
+
 @tool("validate_customer_data", parse_docstring=True)
 def validate_customer_data(
         state: Annotated[InmobiliaState, InjectedState],
@@ -74,6 +115,11 @@ def validate_customer_data(
     Returns:
         ValidationResult: Objeto con `valid: bool` y posibles `errors: List[str]`.
     """
+    # Nada que validar (sólo nombre o ningún dato): se guarda y se sale sin revisar reglas
+    if not (email or telefono or (tipo_documento and numero_documento)):
+        _store_customer_data(state, nombre, email, telefono, tipo_documento, numero_documento)
+        return _VALID_RESULT
+
     errors: List[str] = []
     if email and not _validate_email(email):
         errors.append("Email inválido.")
@@ -81,20 +127,64 @@ def validate_customer_data(
         errors.append("Teléfono inválido.")
     if tipo_documento and numero_documento and not _validate_document(tipo_documento, numero_documento):
         errors.append("Documento inválido.")
-    if not errors:
-        ud = state.get("user_data", {})
-        if nombre: ud["nombre"] = nombre
-        if email:   ud["email"] = email
-        if telefono: ud["telefono"] = telefono
-        if tipo_documento: ud["tipo_documento"] = tipo_documento
-        if numero_documento: ud["numero_documento"] = numero_documento
-        state["user_data"] = ud
-    return ValidationResult(valid=not errors, errors=errors)
+    if errors:
+        return ValidationResult(valid=False, errors=errors)
+    _store_customer_data(state, nombre, email, telefono, tipo_documento, numero_documento)
+    return _VALID_RESULT
 
 
 # ——————————————————————————————————————————————————————
 # 2) TOOLS CRM
 # ——————————————————————————————————————————————————————
+# Los payloads del CRM se arman como dicts planos (mismas claves que
+# PreLead/Lead/EnrichedLead): sin construir el modelo para luego volcarlo.
+# Los códigos se validan contra tablas valor→miembro precalculadas (ValueError si no existen).
+
+_ENUM_MAPS = {
+    E: {m.value: m for m in E}
+    for E in (PropertyType, ZoneOption, AreaRange, BedroomsOption, BudgetOption,
+              TimeframeOption, PurposeOption, YesNo, DocType)
+}
+
+
+def _code(enum_cls: type, value: str) -> str:
+    """Equivale a `enum_cls(value).value` con un lookup de dict, sin pasar por EnumMeta.__call__."""
+    try:
+        return _ENUM_MAPS[enum_cls][value].value
+    except KeyError:
+        raise ValueError(f"{value!r} is not a valid {enum_cls.__name__}") from None
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _err_result(now: str, message: str, errors: Optional[List[str]] = None) -> RegisterLeadResult:
+    return RegisterLeadResult(lead_id="", status="error", timestamp=now, message=message, errors=errors)
+
+
+def _ok_result(now: str, lead_id: str, message: str) -> RegisterLeadResult:
+    return RegisterLeadResult(lead_id=lead_id, status="success", timestamp=now, message=message)
+
+
+def _contacto_payload(nombre: str, telefono: str, email: Optional[str] = None) -> Dict[str, Any]:
+    if not nombre:
+        raise ValueError("El nombre es obligatorio")
+    return {"nombre": nombre, "telefono": telefono, "email": email}
+
+
+def _document_payload(tipo: str, numero: str) -> Dict[str, Any]:
+    numero = numero.strip()
+    if not (3 <= len(numero) <= 15 and numero.isascii() and numero.isalnum()):
+        raise ValueError("Número de documento inválido")
+    return {"tipo": _code(DocType, tipo), "numero": numero}
+
+
+def _proyecto_id(proyecto_id: str) -> str:
+    if not proyecto_id:
+        raise ValueError("El proyecto_id es obligatorio")
+    return proyecto_id
+
 
 @tool("register_prelead", parse_docstring=True)
 def register_prelead(
@@ -124,43 +214,31 @@ def register_prelead(
     Returns:
         RegisterLeadResult: Contiene `lead_id`, `status`, `timestamp`, `message` y opcionales `errors`.
     """
+    # Un único timestamp por llamada, compartido por todos los resultados
+    now = _now()
     v = validate_customer_data(state, nombre=nombre, telefono=telefono)
     if not v.valid:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message="Datos inválidos", errors=v.errors
-        )
+        return _err_result(now, "Datos inválidos", v.errors)
     try:
-        contacto = ContactInfo(nombre=nombre, telefono=telefono)
-        pl = PreLead(
-            contacto=contacto,
-            tipo_inmueble=PropertyType(tipo_inmueble),
-            zona=ZoneOption(zona),
-            metraje=AreaRange(metraje),
-            consentimiento=YesNo.SI,
-            proyecto_id=proyecto_id
-        )
-        lead_id = crm_api.register_prelead(pl.model_dump())
-        ud = state.get("user_data", {})
+        ud = state.setdefault("user_data", {})
+        lead_id = crm_api.upsert_lead(None, "prelead", {
+            "contacto": _contacto_payload(nombre, telefono),
+            "tipo_inmueble": _code(PropertyType, tipo_inmueble),
+            "consentimiento": YesNo.SI.value,
+            "proyecto_id": _proyecto_id(proyecto_id),
+            "zona": _code(ZoneOption, zona),
+            "metraje": _code(AreaRange, metraje),
+        })
         ud.update({
             "lead_id": lead_id, "lead_stage": "prelead",
             "nombre": nombre, "telefono": telefono,
             "tipo_inmueble": tipo_inmueble,
             "zona": zona, "metraje": metraje
         })
-        state["user_data"] = ud
-        return RegisterLeadResult(
-            lead_id=lead_id, status="success",
-            timestamp=datetime.now().isoformat(),
-            message=f"PreLead ID={lead_id}"
-        )
+        add_interaction(state, "prelead", {"lead_id": lead_id})
+        return _ok_result(now, lead_id, f"PreLead ID={lead_id}")
     except Exception as e:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message=str(e), errors=[str(e)]
-        )
+        return _err_result(now, str(e), [str(e)])
 
 
 @tool("register_lead", parse_docstring=True)
@@ -192,49 +270,32 @@ def register_lead(
     Returns:
         RegisterLeadResult: Resultado de la actualización.
     """
-    ud = state.get("user_data", {})
+    now = _now()
+    ud = state.setdefault("user_data", {})
     if "lead_id" not in ud:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message="No existe prelead", errors=["Prelead no encontrado"]
-        )
+        return _err_result(now, "No existe prelead", ["Prelead no encontrado"])
     v = validate_customer_data(
         state, email=email,
         tipo_documento=tipo_documento,
         numero_documento=numero_documento
     )
     if not v.valid:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message="Datos inválidos", errors=v.errors
-        )
+        return _err_result(now, "Datos inválidos", v.errors)
     try:
-        contacto = ContactInfo(
-            nombre=ud["nombre"], telefono=ud["telefono"], email=email
-        )
         doc = None
         if tipo_documento and numero_documento:
-            doc = Document(
-                tipo=DocType(tipo_documento), numero=numero_documento
-            )
-        lead = Lead(
-            contacto=contacto,
-            tipo_inmueble=PropertyType(ud["tipo_inmueble"]),
-            zona=ZoneOption(ud["zona"]),
-            metraje=AreaRange(ud["metraje"]),
-            habitaciones=BedroomsOption(habitaciones),
-            presupuesto=BudgetOption(presupuesto),
-            tiempo_compra=TimeframeOption(tiempo_compra),
-            tiempo_busqueda=TimeframeOption(tiempo_busqueda),
-            document=doc,
-            consentimiento=YesNo.SI,
-            proyecto_id=ud.get("proyecto_id", "WEB001")
-        )
-        ok = crm_api.update_lead(ud["lead_id"], lead.model_dump())
+            doc = _document_payload(tipo_documento, numero_documento)
+        # Sólo los campos nuevos: el CRM los fusiona con el prelead ya registrado
+        ok = crm_api.upsert_lead(ud["lead_id"], "lead", {
+            "contacto": _contacto_payload(ud["nombre"], ud["telefono"], email),
+            "document": doc,
+            "habitaciones": _code(BedroomsOption, habitaciones),
+            "presupuesto": _code(BudgetOption, presupuesto),
+            "tiempo_compra": _code(TimeframeOption, tiempo_compra),
+            "tiempo_busqueda": _code(TimeframeOption, tiempo_busqueda),
+        })
         if not ok:
-            raise RuntimeError("CRM update_lead falló")
+            raise RuntimeError("CRM upsert_lead (lead) falló")
         ud.update({
             "email": email, "habitaciones": habitaciones,
             "presupuesto": presupuesto,
@@ -242,18 +303,10 @@ def register_lead(
             "tiempo_busqueda": tiempo_busqueda,
             "lead_stage": "lead"
         })
-        state["user_data"] = ud
-        return RegisterLeadResult(
-            lead_id=ud["lead_id"], status="success",
-            timestamp=datetime.now().isoformat(),
-            message=f"Lead actualizado ID={ud['lead_id']}"
-        )
+        add_interaction(state, "lead", {"lead_id": ud["lead_id"]})
+        return _ok_result(now, ud["lead_id"], f"Lead actualizado ID={ud['lead_id']}")
     except Exception as e:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message=str(e), errors=[str(e)]
-        )
+        return _err_result(now, str(e), [str(e)])
 
 
 @tool("enrich_lead", parse_docstring=True)
@@ -277,73 +330,46 @@ def enrich_lead(
     Returns:
         RegisterLeadResult: Resultado del enriquecimiento.
     """
-    ud = state.get("user_data", {})
+    now = _now()
+    ud = state.setdefault("user_data", {})
     if "lead_id" not in ud or "email" not in ud:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message="No existe lead completo", errors=["Lead no encontrado"]
-        )
+        return _err_result(now, "No existe lead completo", ["Lead no encontrado"])
     try:
-        contacto = ContactInfo(
-            nombre=ud["nombre"], telefono=ud["telefono"], email=ud["email"]
-        )
-        doc = None
-        if ud.get("tipo_documento") and ud.get("numero_documento"):
-            doc = Document(
-                tipo=DocType(ud["tipo_documento"]),
-                numero=ud["numero_documento"]
-            )
-        enriched = EnrichedLead(
-            contacto=contacto,
-            tipo_inmueble=PropertyType(ud["tipo_inmueble"]),
-            zona=ZoneOption(ud["zona"]),
-            metraje=AreaRange(ud["metraje"]),
-            habitaciones=BedroomsOption(ud["habitaciones"]),
-            presupuesto=BudgetOption(ud["presupuesto"]),
-            tiempo_compra=TimeframeOption(ud["tiempo_compra"]),
-            tiempo_busqueda=TimeframeOption(ud["tiempo_busqueda"]),
-            credito_preaprobado=YesNo(credito_preaprobado),
-            cuota_inicial=YesNo(cuota_inicial),
-            proposito=PurposeOption(proposito),
-            document=doc,
-            consentimiento=YesNo.SI,
-            proyecto_id=ud.get("proyecto_id", "WEB001")
-        )
-        ok = crm_api.enrich_lead(ud["lead_id"], enriched.model_dump())
+        # Contacto y documento ya están en el CRM desde register_lead: no se reenvían
+        ok = crm_api.upsert_lead(ud["lead_id"], "enriched_lead", {
+            "credito_preaprobado": _code(YesNo, credito_preaprobado),
+            "cuota_inicial": _code(YesNo, cuota_inicial),
+            "proposito": _code(PurposeOption, proposito),
+        })
         if not ok:
-            raise RuntimeError("CRM enrich_lead falló")
+            raise RuntimeError("CRM upsert_lead (enriched_lead) falló")
         ud.update({
             "credito_preaprobado": credito_preaprobado,
             "cuota_inicial": cuota_inicial,
             "proposito": proposito,
             "lead_stage": "enriched_lead"
         })
-        state["user_data"] = ud
-        return RegisterLeadResult(
-            lead_id=ud["lead_id"], status="success",
-            timestamp=datetime.now().isoformat(),
-            message=f"Lead enriquecido ID={ud['lead_id']}"
-        )
+        add_interaction(state, "enriched_lead", {"lead_id": ud["lead_id"]})
+        return _ok_result(now, ud["lead_id"], f"Lead enriquecido ID={ud['lead_id']}")
     except Exception as e:
-        return RegisterLeadResult(
-            lead_id="", status="error",
-            timestamp=datetime.now().isoformat(),
-            message=str(e), errors=[str(e)]
-        )
+        return _err_result(now, str(e), [str(e)])
 
 
 # ——————————————————————————————————————————————————————
 # 3) TOOLS PROPIEDADES
 # ——————————————————————————————————————————————————————
 
+# Límites superiores (inclusive) de cada BudgetOption; bisect_left respeta el `<=`
+_BUDGET_THRESHOLDS = (350_000, 500_000, 650_000, 800_000, 1_000_000)
+_BUDGET_LABELS = ("1", "2", "3", "4", "5", "6")
+
+
 def _map_budget(max_price: float) -> str:
-    if max_price <= 350_000: return "1"
-    if max_price <= 500_000: return "2"
-    if max_price <= 650_000: return "3"
-    if max_price <= 800_000: return "4"
-    if max_price <= 1_000_000: return "5"
-    return "6"
+    return _BUDGET_LABELS[bisect_left(_BUDGET_THRESHOLDS, max_price)]
+
+
+# Tuplas inmutables: todas las propiedades de respaldo comparten el mismo objeto
+_DEFAULT_AMENIDADES = ("Seguridad 24/7", "Estacionamiento")
 
 
 def generate_fallback_properties(
@@ -352,23 +378,37 @@ def generate_fallback_properties(
         max_precio: Optional[float] = None,
         habitaciones: Optional[int] = None,
         max_results: int = 2
-) -> List[Dict[str, Any]]:
+) -> Iterator[Dict[str, Any]]:
+    """Genera (perezosamente) propiedades de respaldo; el llamador decide cuántas materializar."""
     zd = zona or "Lima"
     tipo = tipo or "Departamento"
     base = max_precio * 0.9 if max_precio else 150_000
     hab = habitaciones or 2
-    out = []
     for i in range(max_results):
-        out.append({
+        yield {
             "id": f"FB-{zd}-{i + 1}",
             "titulo": f"{tipo} en {zd}",
             "precio": base * (1 + 0.05 * i),
             "habitaciones": hab + i,
             "descripcion": f"Propiedad en {zd} con {hab + i} habitaciones.",
-            "amenidades": ["Seguridad 24/7", "Estacionamiento"],
-            "fotos": []
-        })
-    return out
+            "amenidades": _DEFAULT_AMENIDADES,
+            "fotos": ()
+        }
+
+
+@tool("classify_distrito", parse_docstring=True)
+def classify_distrito(distrito: str) -> int:
+    """Traduce un distrito de Lima/Callao a su código de zona.
+
+    Reemplaza la tabla de distritos que antes viajaba en cada prompt.
+
+    Args:
+        distrito: Nombre del distrito (con o sin tildes, p. ej. "Jesus Maria").
+
+    Returns:
+        Código de zona 1-7, u 8 (FUERA DE LIMA) si el distrito no es reconocido.
+    """
+    return ZONE_MAP.get(normalize_distrito(distrito), ZONA_FUERA_DE_LIMA)
 
 
 # ——————————————————————————————————————————————————————
@@ -394,25 +434,104 @@ def register_property_interest(
     Returns:
         Resultado del registro con estado y mensaje
     """
-    ud = state.get("user_data", {})
+    ud = state.setdefault("user_data", {})
     if not ud.get("nombre") or not ud.get("telefono"):
         return {"status": "error", "message": "Faltan datos básicos"}
-    ints = ud.get("propiedades_interes", [])
-    now = datetime.now().isoformat()
-    for i, x in enumerate(ints):
-        if x["id"] == property_id:
-            ints[i] = {"id": property_id, "nivel": interest_level, "timestamp": now}
-            break
-    else:
-        ints.append({"id": property_id, "nivel": interest_level, "timestamp": now})
+    # property_id → {nivel, timestamp}: actualizar es O(1) y conserva el orden de alta
+    ints = ud.get("propiedades_interes", {})
+    if isinstance(ints, list):  # sesiones anteriores guardaban una lista
+        ints = {x["id"]: {"nivel": x["nivel"], "timestamp": x["timestamp"]} for x in ints}
+    ints[property_id] = {"nivel": interest_level, "timestamp": _now()}
     ud["propiedades_interes"] = ints
-    state["user_data"] = ud
+    add_interaction(state, "property_interest", {"property_id": property_id, "nivel": interest_level})
     return {"status": "success", "message": f"Interés registrado en {property_id}"}
 
 
 # ——————————————————————————————————————————————————————
 # 5) TOOLS SQL
 # ——————————————————————————————————————————————————————
+# Pool de conexiones compartido por todas las tools SQL (se abre al primer uso):
+# evita el handshake TCP/TLS + auth de un connect() por cada llamada.
+_PG_POOL_MAX = 16
+
+
+class _PreparingConnection(connection):
+    """Conexión que recuerda qué sentencias ya preparó en su sesión de servidor."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: set = set()
+
+
+@cache
+def _pg_pool() -> ThreadedConnectionPool:
+    return ThreadedConnectionPool(
+        1, _PG_POOL_MAX, configuration.POSTGRES_URI, connection_factory=_PreparingConnection
+    )
+
+
+def _ensure_prepared(conn: _PreparingConnection, cursor: Any, name: str) -> None:
+    # PREPARE vive en la sesión (no se deshace con rollback): basta una vez por conexión
+    if name not in conn.prepared:
+        cursor.execute(PREPARED_STATEMENTS[name])
+        conn.prepared.add(name)
+
+
+@contextmanager
+def _conn():
+    """Toma una conexión del pool y la devuelve al salir (putconn hace rollback si quedó abierta)."""
+    pool = _pg_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+# Catálogo de proyectos (detalle e imágenes): datos casi estáticos que el agente
+# consulta repetidamente en una sesión. Se cachean por project_id como tuplas
+# inmutables; los errores de BD no se cachean.
+_CATALOG_CACHE_SIZE = 512
+_CATALOG_CACHE_TTL = 600
+
+
+@cached(TTLCache(maxsize=_CATALOG_CACHE_SIZE, ttl=_CATALOG_CACHE_TTL), lock=threading.Lock())
+def _fetch_project_detail(project_id: int) -> Optional[Tuple[Tuple[str, Any], ...]]:
+    sql, params = build_query_project_detail(project_id)
+    with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        _ensure_prepared(conn, cursor, PROJECT_DETAIL_STMT)
+        cursor.execute(sql, params)
+        result = cursor.fetchone()
+    return tuple(result.items()) if result else None
+
+
+@cached(TTLCache(maxsize=_CATALOG_CACHE_SIZE, ttl=_CATALOG_CACHE_TTL), lock=threading.Lock())
+def _fetch_project_images(project_id: int) -> Tuple[Tuple[str, str], ...]:
+    sql, params = build_query_project_images(project_id)
+    with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(sql, params)
+        return tuple((row["tipo"], row["url"]) for row in cursor.fetchall())
+
+
+# Proyecciones mínimas por defecto: el agente pide campos pesados
+# (descripcion, amenidades, fotos, imagen...) sólo cuando los necesita.
+_DEFAULT_UNIT_FIELDS = ("id", "titulo", "precio", "habitaciones", "proyecto")
+_DEFAULT_PROJECT_UNIT_FIELDS = ("id", "titulo", "precio", "habitaciones")
+
+
+def _project_fields(
+        rows: List[Dict[str, Any]],
+        fields: Optional[List[str]],
+        default: Optional[tuple] = None
+) -> List[Dict[str, Any]]:
+    """Devuelve sólo los campos pedidos (siempre incluye `id`, ignora campos desconocidos)."""
+    wanted = fields or default
+    if not wanted:
+        return rows
+    keep = {"id", *wanted}
+    return [{k: v for k, v in row.items() if k in keep} for row in rows]
+
+
 @tool("sql_query_units", parse_docstring=True)
 def sql_query_units(
         state: Dict[str, Any],
@@ -421,7 +540,8 @@ def sql_query_units(
         min_precio: Optional[float] = None,
         max_precio: Optional[float] = None,
         habitaciones: Optional[int] = None,
-        limit: int = 5
+        limit: int = 5,
+        fields: Optional[List[str]] = None
 ) -> List[Dict[str, Any]]:
     """Busca propiedades según criterios específicos consultando la base de datos.
 
@@ -429,7 +549,7 @@ def sql_query_units(
     resultados formateados listos para mostrar al usuario.
 
     Args:
-        state Dict[str, Any]: Estado compartido inyectado.
+        state (Dict[str, Any]): Estado compartido inyectado.
             Se actualizan `properties_shown`, `interaction_count` y `user_data`.
         zona (str, optional): Distrito o zona.
         tipo_propiedad (str, optional): "departamento", "casa", etc.
@@ -437,6 +557,9 @@ def sql_query_units(
         max_precio (float, optional): Precio máximo USD.
         habitaciones (int, optional): Mínimo # de habitaciones.
         limit (int): Máximo resultados a devolver.
+        fields (List[str], optional): Campos a devolver. Por defecto
+            id, titulo, precio, habitaciones y proyecto; pide explícitamente
+            banios, area, descripcion, amenidades o fotos si los necesitas.
 
     Returns:
         List[Dict[str, Any]]: Lista de propiedades formateadas.
@@ -444,60 +567,60 @@ def sql_query_units(
     # Actualizar el estado igual que hacía query_properties
     state["properties_shown"] = True
     state["interaction_count"] = state.get("interaction_count", 0) + 1
-    ud = state.get("user_data", {})
+    ud = state.setdefault("user_data", {})
     if zona and not ud.get("zona"): ud["zona"] = zona
     if tipo_propiedad and not ud.get("tipo_inmueble"): ud["tipo_inmueble"] = tipo_propiedad
     if habitaciones and not ud.get("habitaciones"): ud["habitaciones"] = str(habitaciones)
     if max_precio and not ud.get("presupuesto"):
         ud["presupuesto"] = _map_budget(max_precio)
-    state["user_data"] = ud
 
     # Construir SQL y ejecutar
-    import psycopg2.extras
-
-    from src.agent.configuration import POSTGRES_URI
-
-    sql = build_query_units(zona, tipo_propiedad, min_precio, max_precio, habitaciones, limit)
+    sql, params = build_query_units(zona, tipo_propiedad, min_precio, max_precio, habitaciones, limit)
 
     try:
-        conn = psycopg2.connect(POSTGRES_URI)
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-
-            # Convertir a formato esperado (estructura similar a la que retornaba project_units_to_properties)
-            formatted_results = []
-            for row in results:
-                formatted_results.append({
-                    "id": f"DB-{row['id']}",
-                    "titulo": row['titulo'] or f"{tipo_propiedad or 'Propiedad'} en {zona or 'Lima'}",
-                    "precio": row['precio'],
-                    "habitaciones": row['habitaciones'],
-                    "banios": row.get('banios'),
-                    "area": row.get('area'),
-                    "descripcion": f"Propiedad en {row.get('zona', zona or 'Lima')} con {row['habitaciones']} habitaciones.",
-                    "proyecto": row.get('proyecto'),
-                    "amenidades": [],  # Puedes adaptarlo si tienes esta información
-                    "fotos": []  # Puedes adaptarlo si tienes URLs de imágenes
-                })
-
-            if not formatted_results:
-                return generate_fallback_properties(zona, tipo_propiedad, max_precio, habitaciones)
-
-            return formatted_results
-    except Exception as e:
+        with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            results = cursor.fetchmany(limit)
+
+            # Convertir a formato esperado (estructura similar a la que retornaba project_units_to_properties).
+            # Todas las columnas vienen en el SELECT (None si son NULL): acceso directo, sin .get()
+            records = [
+                PropertyRecord(
+                    id=f"DB-{row['id']}",
+                    titulo=row['titulo'] or f"{tipo_propiedad or 'Propiedad'} en {zona or 'Lima'}",
+                    precio=row['precio'],
+                    habitaciones=row['habitaciones'],
+                    banios=row['banios'],
+                    area=row['area'],
+                    descripcion=f"Propiedad en {row['zona'] or zona or 'Lima'} con {row['habitaciones']} habitaciones.",
+                    proyecto=row['proyecto'],
+                )
+                for row in results
+            ]
+
+            if not records:
+                return _project_fields(
+                    list(generate_fallback_properties(zona, tipo_propiedad, max_precio, habitaciones)),
+                    fields, _DEFAULT_UNIT_FIELDS
+                )
+
+            # Un solo dict por fila, ya proyectado (mismo criterio que _project_fields)
+            keep = {"id", *(fields or _DEFAULT_UNIT_FIELDS)}
+            return [r.to_dict(keep) for r in records]
+    except Exception:
         # Log error y devolver fallback properties
-        print(f"Error ejecutando SQL: {e}")
-        return generate_fallback_properties(zona, tipo_propiedad, max_precio, habitaciones)
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        logger.exception("Error ejecutando SQL")
+        return _project_fields(
+            list(generate_fallback_properties(zona, tipo_propiedad, max_precio, habitaciones)),
+            fields, _DEFAULT_UNIT_FIELDS
+        )
 
 
 @tool("query_project_detail", parse_docstring=True)
 def query_project_detail(
         state: Annotated[InmobiliaState, InjectedState],
-        project_id: int
+        project_id: int,
+        fields: Optional[List[str]] = None
 ) -> Dict[str, Any]:
     """Obtiene detalles completos de un proyecto inmobiliario específico.
 
@@ -508,38 +631,46 @@ def query_project_detail(
         state (InmobiliaState): Estado compartido inyectado.
             Se actualizan `properties_shown`, `interaction_count` y `user_data`.
         project_id: Identificador único del proyecto
+        fields: Columnas a devolver; si se omite se devuelve el detalle completo
 
     Returns:
         Datos completos del proyecto solicitado
     """
-    import psycopg2.extras
-
-    from src.agent.configuration import POSTGRES_URI
-
-    sql = build_query_project_detail(project_id)
-
     try:
-        conn = psycopg2.connect(POSTGRES_URI)
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(sql)
-            result = cursor.fetchone()
-
-            if not result:
-                return {"error": f"No se encontró el proyecto con ID {project_id}"}
-
-            return dict(result)
+        items = _fetch_project_detail(project_id)
+        if items is None:
+            return {"error": f"No se encontró el proyecto con ID {project_id}"}
+
+        result = dict(items)
+        if fields:
+            result = {k: v for k, v in result.items() if k in fields or k == "project_id"}
+        return result
     except Exception as e:
-        print(f"Error ejecutando SQL: {e}")
+        logger.exception("Error ejecutando SQL")
         return {"error": f"Error al consultar el proyecto: {str(e)}"}
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+
+
+def _format_project_units(project_id: int, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"U-{project_id}-{row['titulo']}",
+            "titulo": row['titulo'],
+            "precio": row['precio'],
+            "habitaciones": row['habitaciones'],
+            "banios": row['banios'],
+            "area": row['area'],
+            "tipologia": row['tipologia'],
+            "imagen": row['imagen_principal']
+        }
+        for row in rows
+    ]
 
 
 @tool("query_units_by_project", parse_docstring=True)
 def query_units_by_project(
         state: Annotated[InmobiliaState, InjectedState],
-        project_id: int
+        project_id: int,
+        fields: Optional[List[str]] = None
 ) -> List[Dict[str, Any]]:
     """Lista todas las unidades disponibles en un proyecto específico.
 
@@ -550,44 +681,26 @@ def query_units_by_project(
         state (InmobiliaState): Estado compartido inyectado.
             Se actualizan `properties_shown`, `interaction_count` y `user_data`.
         project_id: Identificador único del proyecto
+        fields: Campos a devolver. Por defecto id, titulo, precio y habitaciones;
+            pide banios, area, tipologia o imagen si los necesitas
 
     Returns:
         Lista de unidades disponibles con sus características
     """
-    import psycopg2.extras
-
-    from src.agent.configuration import POSTGRES_URI
-
-    sql = build_query_units_by_project(project_id)
+    sql, params = build_query_units_by_project(project_id)
 
     try:
-        conn = psycopg2.connect(POSTGRES_URI)
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(sql)
+        with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql, params)
             results = cursor.fetchall()
 
             if not results:
                 return []
 
-            formatted_results = []
-            for row in results:
-                formatted_results.append({
-                    "id": f"U-{project_id}-{row['titulo']}",
-                    "titulo": row['titulo'],
-                    "precio": row['precio'],
-                    "habitaciones": row['habitaciones'],
-                    "banios": row.get('banios'),
-                    "area": row.get('area'),
-                    "tipologia": row.get('tipologia'),
-                    "imagen": row.get('imagen_principal')
-                })
-            return formatted_results
-    except Exception as e:
-        print(f"Error ejecutando SQL: {e}")
+            return _project_fields(_format_project_units(project_id, results), fields, _DEFAULT_PROJECT_UNIT_FIELDS)
+    except Exception:
+        logger.exception("Error ejecutando SQL")
         return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
 
 
 @tool("query_project_images", parse_docstring=True)
@@ -608,35 +721,61 @@ def query_project_images(
     Returns:
         Lista de imágenes con tipo y URL
     """
-    import psycopg2.extras
+    try:
+        return [{"tipo": tipo, "url": url} for tipo, url in _fetch_project_images(project_id)]
+    except Exception:
+        logger.exception("Error ejecutando SQL")
+        return []
 
-    from src.agent.configuration import POSTGRES_URI
 
-    sql = build_query_project_images(project_id)
+@tool("query_project_bundle", parse_docstring=True)
+def query_project_bundle(
+        state: Annotated[InmobiliaState, InjectedState],
+        project_id: int,
+        fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Obtiene en una sola llamada el detalle, las imágenes y las unidades de un proyecto.
 
-    try:
-        conn = psycopg2.connect(POSTGRES_URI)
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(sql)
-            results = cursor.fetchall()
+    Úsala cuando el usuario quiera "ver el proyecto X" completo, en lugar de
+    llamar por separado a query_project_detail, query_project_images y
+    query_units_by_project.
 
-            if not results:
-                return []
+    Args:
+        state (InmobiliaState): Estado compartido inyectado.
+        project_id: Identificador único del proyecto
+        fields: Campos de cada unidad. Por defecto id, titulo, precio y habitaciones
 
-            return [{"tipo": row["tipo"], "url": row["url"]} for row in results]
+    Returns:
+        Dict con `proyecto`, `imagenes` y `unidades`
+    """
+    try:
+        # Detalle e imágenes salen de los caches de catálogo; sólo las unidades van a la BD
+        detail = _fetch_project_detail(project_id)
+        if detail is None:
+            return {"error": f"No se encontró el proyecto con ID {project_id}"}
+        images = _fetch_project_images(project_id)
+
+        sql, params = build_query_units_by_project(project_id)
+        with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            units = cursor.fetchall()
     except Exception as e:
-        print(f"Error ejecutando SQL: {e}")
-        return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        logger.exception("Error ejecutando SQL")
+        return {"error": f"Error al consultar el proyecto: {str(e)}"}
+
+    return {
+        "proyecto": dict(detail),
+        "imagenes": [{"tipo": tipo, "url": url} for tipo, url in images],
+        "unidades": _project_fields(_format_project_units(project_id, units), fields, _DEFAULT_PROJECT_UNIT_FIELDS),
+    }
 
 
 @tool("query_similar_units", parse_docstring=True)
 def query_similar_units(
         state: Annotated[InmobiliaState, InjectedState],
         unit_id: int,
-        max_results: int = 3
+        max_results: int = 3,
+        fields: Optional[List[str]] = None
 ) -> List[Dict[str, Any]]:
     """Encuentra unidades similares a una unidad específica.
 
@@ -648,38 +787,32 @@ def query_similar_units(
             Se actualizan `properties_shown`, `interaction_count` y `user_data`.
         unit_id: Identificador de la unidad de referencia
         max_results: Cantidad máxima de resultados similares
+        fields: Campos a devolver (id, titulo, precio, habitaciones, zona); por defecto todos
 
     Returns:
         Lista de unidades similares a la de referencia
     """
-    import psycopg2.extras
-
-    from src.agent.configuration import POSTGRES_URI
-
-    sql = build_query_similar_units(unit_id, max_results)
+    sql, params = build_query_similar_units(unit_id, max_results)
 
     try:
-        conn = psycopg2.connect(POSTGRES_URI)
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(sql)
-            results = cursor.fetchall()
+        with _conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            results = cursor.fetchmany(max_results)
 
             if not results:
                 return []
 
-            formatted_results = []
-            for row in results:
-                formatted_results.append({
+            formatted_results = [
+                {
                     "id": f"U-{row['id']}",
                     "titulo": row['titulo'],
                     "precio": row['precio'],
                     "habitaciones": row['habitaciones'],
-                    "zona": row.get('zona', "Lima")
-                })
-            return formatted_results
-    except Exception as e:
-        print(f"Error ejecutando SQL: {e}")
-        return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
\ No newline at end of file
+                    "zona": row['zona'] or "Lima"
+                }
+                for row in results
+            ]
+            return _project_fields(formatted_results, fields)
+    except Exception:
+        logger.exception("Error ejecutando SQL")
+        return []
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+
+# La configuración exige estas variables al importar los módulos del agente
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("POSTGRES_URI", "postgresql://test@localhost/test")
+os.environ.setdefault("MEMORY_BACKEND", "memory")
@@ -0,0 +1,198 @@
+import asyncio
+import operator
+import uuid
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from src.agent.checkpointing import (
+    DeferredCheckpointer,
+    OrjsonSerializer,
+    _is_plain_json,
+)
+from src.agent.models import ZoneOption
+
+
+@pytest.fixture
+def serde():
+    return OrjsonSerializer()
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"user_data": {"nombre": "Ana", "presupuesto": 120000, "ratio": 0.5, "ok": True, "x": None}},
+        ["a", 1, 2.5, False, None, {"k": []}],
+        "texto",
+        0,
+    ],
+)
+def test_plain_json_uses_orjson_and_round_trips(serde, value):
+    type_, payload = serde.dumps_typed(value)
+    assert type_ == "orjson"
+    assert serde.loads_typed((type_, payload)) == value
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"rango": (100, 200)},
+        {"zona": ZoneOption.LIMA_TOP},
+        [uuid.UUID(int=1)],
+        {1: "clave no str"},
+        {"nan": float("nan")},
+    ],
+)
+def test_non_plain_values_are_not_plain_json(value):
+    assert not _is_plain_json(value)
+
+
+def test_enum_values_keep_their_type(serde):
+    value = {"user_data": {"zona": ZoneOption.LIMA_TOP}}
+    type_, payload = serde.dumps_typed(value)
+    assert type_ != "orjson"
+    restored = serde.loads_typed((type_, payload))
+    assert restored == value
+    assert type(restored["user_data"]["zona"]) is ZoneOption
+
+
+def test_tuples_go_to_fallback(serde):
+    type_, _ = serde.dumps_typed({"user_data": {"rango": (100, 200)}})
+    assert type_ == serde.fallback.dumps_typed({})[0]
+
+
+# —— DeferredCheckpointer ———————————————————————————————————————————————
+
+THREAD = "t-1"
+
+
+def _config(ns="", checkpoint_id=None, thread=THREAD):
+    configurable = {"thread_id": thread, "checkpoint_ns": ns}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def _put(saver, ns=""):
+    checkpoint = empty_checkpoint()
+    saver.put(_config(ns), checkpoint, {"source": "loop", "step": 0}, {})
+    return checkpoint
+
+
+async def _aput(saver, ns=""):
+    checkpoint = empty_checkpoint()
+    await saver.aput(_config(ns), checkpoint, {"source": "loop", "step": 0}, {})
+    return checkpoint
+
+
+@pytest.fixture
+def deferred():
+    return DeferredCheckpointer(InMemorySaver())
+
+
+class _State(TypedDict):
+    steps: Annotated[list, operator.add]
+
+
+def _workflow(checkpointer):
+    sub = StateGraph(_State)
+    sub.add_node("inner_a", lambda s: {"steps": ["inner_a"]})
+    sub.add_node("inner_b", lambda s: {"steps": ["inner_b"]})
+    sub.add_edge(START, "inner_a")
+    sub.add_edge("inner_a", "inner_b")
+    sub.add_edge("inner_b", END)
+
+    parent = StateGraph(_State)
+    parent.add_node("before", lambda s: {"steps": ["before"]})
+    parent.add_node("sub", sub.compile())
+    parent.add_node("after", lambda s: {"steps": ["after"]})
+    parent.add_edge(START, "before")
+    parent.add_edge("before", "sub")
+    parent.add_edge("sub", "after")
+    parent.add_edge("after", END)
+    return parent.compile(checkpointer=checkpointer)
+
+
+def test_graph_matches_plain_saver():
+    config = {"configurable": {"thread_id": THREAD}}
+    plain = _workflow(InMemorySaver())
+    deferred = _workflow(DeferredCheckpointer(InMemorySaver()))
+    for _ in range(2):  # el segundo turno parte del estado guardado
+        expected = plain.invoke({"steps": []}, config)
+        assert deferred.invoke({"steps": []}, config) == expected
+
+    def history(graph):
+        return [snapshot.values for snapshot in graph.get_state_history(config)]
+
+    assert history(deferred) == history(plain)
+
+
+def test_subgraph_checkpoint_is_served_from_buffer(deferred):
+    checkpoint = _put(deferred, ns="sub:1")
+    assert deferred.saver.get_tuple(_config("sub:1")) is None
+    buffered = deferred.get_tuple(_config("sub:1"))
+    assert buffered.checkpoint["id"] == checkpoint["id"]
+
+
+def test_root_put_flushes_pending_subgraphs(deferred):
+    checkpoint = _put(deferred, ns="sub:1")
+    _put(deferred)
+    assert deferred.saver.get_tuple(_config("sub:1")).checkpoint["id"] == checkpoint["id"]
+
+
+def test_list_flushes_pending(deferred):
+    checkpoint = _put(deferred, ns="sub:1")
+    listed = list(deferred.list(_config("sub:1")))
+    assert [t.checkpoint["id"] for t in listed] == [checkpoint["id"]]
+    assert deferred.saver.get_tuple(_config("sub:1")) is not None
+
+
+def test_get_tuple_miss_flushes_thread(deferred):
+    checkpoint = _put(deferred, ns="sub:1")
+    # Otro namespace del mismo thread: no se puede servir desde memoria
+    assert deferred.get_tuple(_config("sub:2")) is None
+    assert deferred.saver.get_tuple(_config("sub:1")).checkpoint["id"] == checkpoint["id"]
+
+
+def test_delete_thread_drops_pending(deferred):
+    _put(deferred, ns="sub:1")
+    deferred.delete_thread(THREAD)
+    assert deferred.get_tuple(_config("sub:1")) is None
+    deferred.flush()
+    assert deferred.saver.get_tuple(_config("sub:1")) is None
+
+
+def test_not_deferred_delegates_immediately():
+    saver = DeferredCheckpointer(InMemorySaver(), deferred=False)
+    _put(saver, ns="sub:1")
+    assert saver.saver.get_tuple(_config("sub:1")) is not None
+
+
+def test_async_twins(deferred):
+    async def scenario():
+        checkpoint = await _aput(deferred, ns="sub:1")
+        assert deferred.saver.get_tuple(_config("sub:1")) is None
+        assert (await deferred.aget_tuple(_config("sub:1"))).checkpoint["id"] == checkpoint["id"]
+
+        # aget_tuple sin acierto vuelca el thread
+        assert await deferred.aget_tuple(_config("sub:2")) is None
+        assert deferred.saver.get_tuple(_config("sub:1")) is not None
+
+        # aput raíz y alist vuelcan lo pendiente
+        second = await _aput(deferred, ns="sub:3")
+        await _aput(deferred)
+        assert deferred.saver.get_tuple(_config("sub:3")).checkpoint["id"] == second["id"]
+        third = await _aput(deferred, ns="sub:4")
+        listed = [t async for t in deferred.alist(_config("sub:4"))]
+        assert [t.checkpoint["id"] for t in listed] == [third["id"]]
+
+        # adelete_thread descarta lo pendiente
+        await _aput(deferred, ns="sub:5")
+        await deferred.adelete_thread(THREAD)
+        await deferred.aflush()
+        assert deferred.saver.get_tuple(_config("sub:5")) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import pytest
+
+from src.agent import tools
+from src.agent.models import BudgetOption, DocType, PropertyType, YesNo, ZoneOption
+from src.agent.tools import _BUDGET_THRESHOLDS, _code, _map_budget
+
+
+@pytest.mark.parametrize(
+    "price, label",
+    [
+        (0, "1"),
+        (350_000, "1"),
+        (350_001, "2"),
+        (500_000, "2"),
+        (650_000, "3"),
+        (800_000, "4"),
+        (1_000_000, "5"),
+        (1_000_001, "6"),
+    ],
+)
+def test_map_budget_thresholds_are_inclusive(price, label):
+    assert _map_budget(price) == label
+
+
+def test_map_budget_labels_are_budget_options():
+    labels = {_map_budget(t) for t in _BUDGET_THRESHOLDS} | {_map_budget(_BUDGET_THRESHOLDS[-1] + 1)}
+    assert labels == {m.value for m in BudgetOption}
+
+
+@pytest.mark.parametrize("enum_cls", [PropertyType, ZoneOption, YesNo, DocType])
+def test_code_matches_enum_constructor(enum_cls):
+    for member in enum_cls:
+        assert _code(enum_cls, member.value) == enum_cls(member.value).value
+
+
+def test_code_rejects_unknown_values():
+    with pytest.raises(ValueError, match="is not a valid ZoneOption"):
+        _code(ZoneOption, "99")
+
+
+@pytest.fixture
+def db_down(monkeypatch):
+    def _pool():
+        raise ConnectionError("sin base de datos")
+
+    monkeypatch.setattr(tools, "_pg_pool", _pool)
+
+
+def test_sql_query_units_fallback_uses_default_projection(db_down):
+    rows = tools.sql_query_units.func(state={}, zona="Miraflores")
+    assert rows
+    assert all(set(row) == {"id", "titulo", "precio", "habitaciones"} for row in rows)
+
+
+def test_sql_query_units_fallback_honors_fields(db_down):
+    rows = tools.sql_query_units.func(state={}, zona="Miraflores", fields=["descripcion"])
+    assert all(set(row) == {"id", "descripcion"} for row in rows)